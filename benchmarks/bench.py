@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+
+# Benchmarks for the hot paths of xwallpapergui on synthetic data:
+# topologies of 1 to 24 outputs made of ScreenMock objects, configuration
+# stores of 10 to 1000 configurations and images of 1080p to 16K.
+#
+#   $ benchmarks/bench.py -o results.jsonl
+#
+# Each result is printed as one JSON object per line, so results of
+# different revisions can be compared with any JSON-aware tool.
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from os.path import abspath, dirname, join
+from statistics import median
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+from engine import ConfigRecord, screens_from_qt
+from store import JsonStore, QSettingsStore
+from imagecache import ThumbnailCache
+from gui import GUI, ScreenMock
+
+IMAGE_SIZES = {
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+    "16k": (15360, 8640),
+}
+
+def synthetic_screens(n_outputs, width=1920, height=1080, columns=6):
+    mocks = []
+    for i in range(n_outputs):
+        rect = QtCore.QRect((i % columns) * width, (i // columns) * height, width, height)
+        mocks.append(ScreenMock(rect, f"OUT-{i}", "Synthetic", f"Model {i % 3}", f"SN{i:06d}"))
+    return screens_from_qt(mocks)
+
+def synthetic_image(directory, size_name):
+    path = join(directory, f"{size_name}.jpg")
+    if not os.path.exists(path):
+        width, height = IMAGE_SIZES[size_name]
+        image = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
+        gradient = QtGui.QLinearGradient(0, 0, width, height)
+        gradient.setColorAt(0, QtGui.QColor("navy"))
+        gradient.setColorAt(1, QtGui.QColor("orange"))
+        painter = QtGui.QPainter(image)
+        painter.fillRect(image.rect(), gradient)
+        painter.end()
+        image.save(path, "JPG", 90)
+    return path
+
+def synthetic_config(n_outputs, index, image):
+    screens = synthetic_screens(n_outputs)
+    for screen in screens:
+        screen.path = image
+    config = ConfigRecord.new(screens)
+    # Make IDs distinct, like configurations for different sets of monitors
+    config.id = f"{index:04d}{config.id[4:]}"
+    config.name = f"Synthetic {index}"
+    return config
+
+def synthetic_store(store, n_configs, n_outputs, image):
+    configs = [synthetic_config(n_outputs, i, image) for i in range(n_configs)]
+    for config in configs:
+        config.save(store)
+    store.sync()
+    return configs
+
+def open_stores(directory, backend):
+    if backend == "json":
+        return JsonStore(join(directory, "bench.json"))
+    return QSettingsStore(QtCore.QSettings(join(directory, "bench.conf"), QtCore.QSettings.Format.NativeFormat))
+
+def measure(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+class Reporter:
+    def __init__(self, output):
+        self.output = output
+
+    def report(self, name, params, timings):
+        result = dict(benchmark = name, params = params, runs = len(timings),
+                      min_ms = min(timings) * 1000.0, median_ms = median(timings) * 1000.0,
+                      max_ms = max(timings) * 1000.0)
+        line = json.dumps(result)
+        print(line)
+        if self.output is not None:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+def bench_topology(reporter, args):
+    for n_outputs in args.outputs:
+        screens = synthetic_screens(n_outputs)
+        reporter.report("screens_hash", dict(outputs = n_outputs), measure(lambda: ConfigRecord.screens_hash(screens), args.runs))
+
+def bench_store(reporter, args, directory, image):
+    for backend in args.backends:
+        for n_configs in args.configs:
+            store_dir = tempfile.mkdtemp(dir=directory)
+            configs = synthetic_store(open_stores(store_dir, backend), n_configs, args.store_outputs, image)
+            params = dict(backend = backend, configs = n_configs, outputs = args.store_outputs)
+            reporter.report("list_from_store", params,
+                            measure(lambda: ConfigRecord.list_from_store(open_stores(store_dir, backend)), args.runs))
+            store = open_stores(store_dir, backend)
+            last_id = configs[-1].id
+            reporter.report("load", params, measure(lambda: ConfigRecord.load(store, last_id), args.runs))
+
+            # put() skips unchanged configurations, so one field changes per run
+            n_saves = [0]
+            def save():
+                n_saves[0] += 1
+                configs[-1].name = f"Saved {n_saves[0]}"
+                configs[-1].save(store)
+                store.sync()
+            reporter.report("save", params, measure(save, args.runs))
+
+def bench_apply(reporter, args, image):
+    for n_outputs in args.outputs:
+        config = synthetic_config(n_outputs, 0, image)
+        reporter.report("command", dict(outputs = n_outputs, render = False),
+                        measure(lambda: config.command(render=False), args.runs))
+        config.command(render=True)
+        reporter.report("command", dict(outputs = n_outputs, render = True),
+                        measure(lambda: config.command(render=True), args.runs))
+
+def bench_images(reporter, args, directory):
+    cache = ThumbnailCache(join(directory, "thumbnails"))
+    for size_name in args.images:
+        image = synthetic_image(directory, size_name)
+        cold = ThumbnailCache(tempfile.mkdtemp(dir=directory))
+        reporter.report("thumbnail_cold", dict(image = size_name),
+                        measure(lambda: cold.get(image, 320, 180), 1))
+        cache.get(image, 320, 180)
+        reporter.report("thumbnail_cached", dict(image = size_name),
+                        measure(lambda: cache.get(image, 320, 180), args.runs))
+
+def bench_gui(reporter, args, directory, image):
+    class GuiArgs:
+        config = join(directory, "gui.json")
+        verbose = False
+    win = GUI(GuiArgs())
+    for n_outputs in args.outputs:
+        config = synthetic_config(n_outputs, 0, image)
+        reporter.report("load_config", dict(outputs = n_outputs), measure(lambda: win.load_config(config), args.runs))
+    win.preview_loader.wait()
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+def str_list(value):
+    return value.split(",")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run xwallpapergui benchmarks on synthetic data")
+    parser.add_argument('-r', '--runs', type=int, default=10, help="Number of runs of each benchmark")
+    parser.add_argument('-o', '--output', metavar="FILE", help="Append results to FILE in JSON lines format")
+    parser.add_argument('--outputs', type=int_list, default=[1, 2, 4, 8, 16, 24], help="Comma-separated numbers of outputs in synthetic topologies")
+    parser.add_argument('--configs', type=int_list, default=[10, 100, 1000], help="Comma-separated numbers of configurations in synthetic stores")
+    parser.add_argument('--store-outputs', type=int, default=3, help="Number of outputs in each configuration of synthetic stores")
+    parser.add_argument('--backends', type=str_list, default=["json", "qsettings"], help="Comma-separated list of configuration stores")
+    parser.add_argument('--images', type=str_list, default=["1080p", "4k", "8k"], help="Comma-separated list of image sizes: " + ", ".join(IMAGE_SIZES.keys()))
+    parser.add_argument('benchmarks', nargs='*', default=["topology", "store", "apply", "images", "gui"], help="Benchmarks to run")
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+    output = open(args.output, 'a') if args.output else None
+    reporter = Reporter(output)
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["XDG_CACHE_HOME"] = join(directory, "cache")
+        image = synthetic_image(directory, "1080p")
+        if "topology" in args.benchmarks:
+            bench_topology(reporter, args)
+        if "store" in args.benchmarks:
+            bench_store(reporter, args, directory, image)
+        if "apply" in args.benchmarks:
+            bench_apply(reporter, args, image)
+        if "images" in args.benchmarks:
+            bench_images(reporter, args, directory)
+        if "gui" in args.benchmarks:
+            bench_gui(reporter, args, directory, image)
+    if output is not None:
+        output.close()
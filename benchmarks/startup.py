@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+
+# Measure start-up time of the command-line fast paths, which are typically
+# launched from udev/autorandr hooks on every monitor hotplug.
+#
+#   $ benchmarks/startup.py -r 20
+#
+# `apply` is run with --dry-run, so xwallpaper is not executed.
+
+import sys
+import time
+import argparse
+import subprocess
+from os.path import abspath, dirname, join
+from statistics import median
+
+SCRIPT = join(dirname(dirname(abspath(__file__))), "xwallpapergui.py")
+
+COMMANDS = {
+    "apply": ["apply", "--dry-run"],
+    "list": ["list"],
+}
+
+def measure(args, runs, extra):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, SCRIPT] + extra + args, stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure start-up time of xwallpapergui command-line actions")
+    parser.add_argument('-r', '--runs', type=int, default=10, help="Number of runs per command")
+    parser.add_argument('-c', '--config', metavar='XWALLPAPERGUI.CONF', help="Configuration file to use")
+    parser.add_argument('commands', nargs='*', default=list(COMMANDS.keys()), help="Commands to measure")
+    args = parser.parse_args()
+
+    extra = ["-c", args.config] if args.config else []
+    print(f"{'command':<10} {'min, ms':>10} {'median, ms':>12} {'max, ms':>10}")
+    for command in args.commands:
+        timings = measure(COMMANDS[command], args.runs, extra)
+        print(f"{command:<10} {min(timings):>10.1f} {median(timings):>12.1f} {max(timings):>10.1f}")
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+# Check the native backend (--backend native) against a virtual X server:
+# Xvfb is started, a test pattern is applied with the native backend, and the
+# root pixmap published in _XROOTPMAP_ID is read back pixel by pixel.
+#
+#   $ benchmarks/xvfb_native.py
+#
+# Needs Xvfb, xrandr and python-xlib. The pattern is larger than the maximum
+# request size of X, so uploading it in chunks is checked too, and it is
+# applied twice, so that freeing the pixmap of the previous wallpaper is.
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+from os.path import abspath, dirname, join
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from PyQt5 import QtGui
+
+ROWS_PER_READ = 64
+
+def start_xvfb(width, height, depth):
+    read_fd, write_fd = os.pipe()
+    process = subprocess.Popen(["Xvfb", "-displayfd", str(write_fd), "-nolisten", "tcp",
+                                "-screen", "0", f"{width}x{height}x{depth}"],
+                               pass_fds=(write_fd,), stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        number = f.readline().strip()
+    if not number:
+        process.kill()
+        raise OSError("Xvfb did not start")
+    return process, f":{number}"
+
+def pattern(width, height):
+    # Every row and column differs, so that misplaced chunks are noticed
+    data = bytearray(width * height * 4)
+    for y in range(height):
+        offset = y * width * 4
+        for x in range(width):
+            i = offset + x * 4
+            data[i] = x & 0xff
+            data[i + 1] = y & 0xff
+            data[i + 2] = ((x >> 8) << 4 | (y >> 8)) & 0xff
+            data[i + 3] = 0xff
+    return bytes(data)
+
+def read_root_pixmap(name, width, height):
+    from Xlib import X, Xatom, display
+    d = display.Display(name)
+    try:
+        root = d.screen().root
+        xrootpmap = root.get_full_property(d.intern_atom("_XROOTPMAP_ID"), Xatom.PIXMAP)
+        esetroot = root.get_full_property(d.intern_atom("ESETROOT_PMAP_ID"), Xatom.PIXMAP)
+        if xrootpmap is None or esetroot is None or xrootpmap.value[0] != esetroot.value[0]:
+            raise AssertionError("_XROOTPMAP_ID and ESETROOT_PMAP_ID are not set to the same pixmap")
+        pixmap = d.create_resource_object("pixmap", xrootpmap.value[0])
+        data = bytearray()
+        for top in range(0, height, ROWS_PER_READ):
+            rows = min(ROWS_PER_READ, height - top)
+            data += pixmap.get_image(0, top, width, rows, X.ZPixmap, 0xffffffff).data
+        return xrootpmap.value[0], bytes(data)
+    finally:
+        d.close()
+
+def compare(expected, actual, width):
+    if len(expected) != len(actual):
+        raise AssertionError(f"Read {len(actual)} bytes of the root pixmap, expected {len(expected)}")
+    # The fourth byte of each pixel is padding
+    for i in range(0, len(expected), 4):
+        if expected[i:i + 3] != actual[i:i + 3]:
+            pixel = i // 4
+            raise AssertionError(f"Pixel {pixel % width},{pixel // width} is {actual[i:i + 3].hex()}, expected {expected[i:i + 3].hex()}")
+
+def check(name, directory, width, height):
+    os.environ["DISPLAY"] = name
+    from engine import ConfigRecord, detect_screens
+    from rootpixmap import set_backend
+    set_backend("native")
+    screens = detect_screens(fallback=False)
+    if [(s.x, s.y, s.width, s.height) for s in screens] != [(0, 0, width, height)]:
+        raise AssertionError(f"Unexpected screens: {screens}")
+    expected = pattern(width, height)
+    image = QtGui.QImage(expected, width, height, QtGui.QImage.Format_RGB32)
+    path = join(directory, "pattern.png")
+    if not image.save(path):
+        raise OSError(f"Can not write {path}")
+    config = ConfigRecord.new(screens)
+    for screen in config.screens:
+        screen.path = path
+        screen.mode = "--zoom"
+    pixmaps = []
+    for _ in range(2):
+        status, _, error = config.run(force=True, capture=True)
+        if status != 0:
+            raise AssertionError(f"Applying failed with status {status}: {error}")
+        pixmap, actual = read_root_pixmap(name, width, height)
+        compare(expected, actual, width)
+        pixmaps.append(pixmap)
+    if pixmaps[0] == pixmaps[1]:
+        raise AssertionError("The root pixmap was not replaced")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the native wallpaper backend against Xvfb")
+    parser.add_argument('--size', metavar='WxH', default="1024x768", help="Size of the virtual screen")
+    args = parser.parse_args()
+    width, height = (int(n) for n in args.size.split("x"))
+
+    for tool in ("Xvfb", "xrandr"):
+        if shutil.which(tool) is None:
+            sys.exit(f"{tool} is not installed")
+    try:
+        import Xlib
+    except ImportError:
+        sys.exit("python-xlib is not installed")
+
+    directory = tempfile.mkdtemp()
+    # Keep the render cache and the applied state of the user untouched
+    os.environ["XDG_CACHE_HOME"] = join(directory, "cache")
+    os.environ["XDG_RUNTIME_DIR"] = directory
+    process, name = start_xvfb(width, height, 24)
+    try:
+        check(name, directory, width, height)
+    except AssertionError as e:
+        sys.exit(f"FAILED: {e}")
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+    print(f"OK: native backend set a {width}x{height} root pixmap on {name}")
@@ -0,0 +1,99 @@
+import os
+import threading
+from os.path import abspath, expanduser, join
+from hashlib import md5
+
+# No Qt imports here: this module is used on the `apply` fast path, where
+# a cache hit must not require loading QtGui.
+
+EVICT_EVERY = 32
+
+def get_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or expanduser("~/.cache")
+    return join(base, "xwallpapergui")
+
+def atomic_save(image, path, fmt="PNG", quality=-1):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if not image.save(tmp, fmt, quality):
+        return False
+    os.replace(tmp, path)
+    return True
+
+def file_stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def file_key(path, *params, stamp=None):
+    # stamp gives the size and mtime of a previous version of the file
+    path = abspath(path)
+    if stamp is None:
+        stamp = file_stamp(path)
+    s = "|".join([path, str(stamp[0]), str(stamp[1])] + [str(p) for p in params])
+    return md5(s.encode('utf-8')).hexdigest()
+
+class FileCache:
+    def __init__(self, directory, max_bytes, extension=".png"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self._lock = threading.Lock()
+        self._stored = 0
+
+    def file(self, key):
+        return join(self.directory, key + self.extension)
+
+    def lookup(self, key):
+        cached = self.file(key)
+        if not os.path.exists(cached):
+            return None
+        try:
+            os.utime(cached)
+        except OSError:
+            pass
+        return cached
+
+    def remove(self, key):
+        try:
+            os.remove(self.file(key))
+        except OSError:
+            pass
+
+    def store(self, key, image, fmt="PNG", quality=-1):
+        cached = self.file(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if not atomic_save(image, cached, fmt, quality):
+                return None
+        except OSError:
+            return None
+        with self._lock:
+            self._stored += 1
+            evict = self._stored >= EVICT_EVERY
+            if evict:
+                self._stored = 0
+        if evict:
+            self.evict()
+        return cached
+
+    def evict(self):
+        with self._lock:
+            try:
+                entries = [e for e in os.scandir(self.directory) if e.name.endswith(self.extension)]
+            except OSError:
+                return
+            stats = []
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                stats.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in stats)
+            for _, size, path in sorted(stats):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
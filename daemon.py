@@ -0,0 +1,144 @@
+import os
+import sys
+import signal
+from PyQt5 import QtCore, QtGui
+from engine import ConfigRecord, Topology
+from store import open_store
+from slideshow import Slideshow
+from filewatch import FileWatcher
+import profiling
+
+DEFAULT_DEBOUNCE_MS = 500
+RETRY_MS = 5000
+
+class Daemon(QtCore.QObject):
+    def __init__(self, app, store, debounce=DEFAULT_DEBOUNCE_MS, verbose=False, watch=False):
+        super().__init__()
+        self.store = store
+        self.verbose = verbose
+        self.topology = Topology(app, self)
+        self.applied_hash = None
+        self.configs = dict()
+        self._store_stamp = None
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounce)
+        self.timer.timeout.connect(self.apply)
+        # Applying fails when there is no configuration yet, or when X is not
+        # ready; it is retried until it succeeds or screens change again
+        self.retry_timer = QtCore.QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.setInterval(RETRY_MS)
+        self.retry_timer.timeout.connect(self.apply)
+        self.slideshow = Slideshow(self, verbose)
+        self.slideshow.due.connect(self.next_slide)
+        self.file_watcher = None
+        if watch:
+            self.file_watcher = FileWatcher(self, debounce)
+            self.file_watcher.changed.connect(self.files_changed)
+        # Docking a laptop produces a burst of screen notifications;
+        # every new one restarts the timer.
+        self.topology.changed.connect(self.timer.start)
+
+    def _store_changed(self):
+        try:
+            st = os.stat(self.store.path)
+            stamp = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            stamp = None
+        if stamp == self._store_stamp:
+            return False
+        self._store_stamp = stamp
+        return True
+
+    def load_configs(self):
+        if not self._store_changed():
+            return
+        self.store.sync()
+        self.configs = dict((cfg.id, cfg) for cfg in ConfigRecord.list_from_store(self.store))
+        if self.verbose:
+            print(f"Loaded {len(self.configs)} configurations")
+
+    def current_config(self):
+        self.load_configs()
+        config = self.configs.get(self.topology.hash())
+        if config is not None:
+            return config
+        screens = self.topology.screens()
+        for config in self.configs.values():
+            if config.matches(screens):
+                return config
+        return None
+
+    def apply(self):
+        screens_hash = self.topology.hash()
+        if screens_hash == self.applied_hash:
+            if self.verbose:
+                print(f"Screens did not change: {screens_hash}")
+            return
+        self.retry_timer.stop()
+        config = self.current_config()
+        if config is None:
+            self.slideshow.stop()
+            self.watch(None)
+            if self.verbose:
+                print(f"No configuration for screens {screens_hash}")
+            self.retry_timer.start()
+            return
+        if self.verbose:
+            print(f"Applying configuration {config.id}: {config.name}")
+        # The root window may have been reset when screens changed
+        status = config.apply(self.verbose, force=True)
+        if status:
+            if self.verbose:
+                print(f"Applying failed with status {status}, retrying in {RETRY_MS} ms")
+            self.retry_timer.start()
+            return
+        self.applied_hash = screens_hash
+        self.slideshow.start(config)
+        self.watch(config)
+
+    def next_slide(self, when):
+        # Pick up changes of slideshows made while the daemon was running
+        config = self.current_config()
+        if config is None:
+            self.slideshow.stop()
+            self.watch(None)
+            return
+        config.apply(self.verbose, when=when)
+        self.slideshow.start(config, when)
+        self.watch(config, when)
+
+    def watch(self, config, when=None):
+        if self.file_watcher is not None:
+            self.file_watcher.watch(config.image_paths(when) if config is not None else ())
+
+    def files_changed(self, changed):
+        config = self.current_config()
+        if config is None:
+            return
+        if self.verbose:
+            print(f"Changed: {', '.join(sorted(changed))}")
+        # Images of outputs whose files did not change are still in the render
+        # cache, so only the changed ones are rendered again
+        config.invalidate(changed)
+        config.apply(self.verbose)
+        self.watch(config)
+
+def run_daemon(args):
+    with profiling.span("start Qt"):
+        app = QtGui.QGuiApplication(sys.argv)
+    app.setQuitOnLastWindowClosed(False)
+    with profiling.span("open store"):
+        store = open_store(args)
+    daemon = Daemon(app, store, args.debounce, args.verbose, args.watch)
+    daemon.apply()
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal.signal(signal.SIGTERM, lambda *_: app.quit())
+    # Let the Python interpreter handle signals while Qt event loop is running
+    timer = QtCore.QTimer()
+    timer.timeout.connect(lambda: None)
+    timer.start(500)
+    status = app.exec_()
+    daemon.slideshow.shutdown()
+    sys.exit(status)
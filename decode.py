@@ -0,0 +1,109 @@
+from math import ceil
+from PyQt5 import QtCore, QtGui
+import profiling
+
+# Images are decoded with QImageReader so that only the part of the image
+# which will be displayed is read (setClipRect), already scaled down to the
+# size it will be displayed at (setScaledSize, which the JPEG plugin does
+# during DCT). EXIF orientation is applied by the reader.
+#
+# QImageReader in Qt 5 has no allocation limit, so the memory needed to decode
+# an image is estimated beforehand: formats which can not decode at a reduced
+# size need the whole image in memory, JPEG needs at least 1/8 of each side.
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+BYTES_PER_PIXEL = 4
+DCT_SCALED_FORMATS = {b"jpeg", b"jpg"}
+
+_memory_budget = DEFAULT_MEMORY_BUDGET
+
+def set_memory_budget(max_bytes):
+    global _memory_budget
+    _memory_budget = max_bytes
+
+def get_memory_budget():
+    return _memory_budget
+
+def centered(width, height, crop_width, crop_height):
+    crop_width = min(width, max(1, crop_width))
+    crop_height = min(height, max(1, crop_height))
+    return QtCore.QRect((width - crop_width) // 2, (height - crop_height) // 2, crop_width, crop_height)
+
+def decode_region(width, height, target_width, target_height, mode):
+    # Returns the part of the image to decode and the size to decode it at,
+    # both in the coordinates of the image as displayed.
+    if mode == "--stretch":
+        return None, QtCore.QSize(min(width, target_width), min(height, target_height))
+    if mode == "--maximize":
+        scale = min(target_width / width, target_height / height, 1.0)
+        return None, QtCore.QSize(max(1, ceil(width * scale)), max(1, ceil(height * scale)))
+    if mode == "--center":
+        clip = centered(width, height, target_width, target_height)
+        return clip, clip.size()
+    if mode == "--tile":
+        clip = QtCore.QRect(0, 0, min(width, target_width), min(height, target_height))
+        return clip, clip.size()
+    # --zoom: cover the target, cutting off what does not fit
+    scale = max(target_width / width, target_height / height)
+    clip = centered(width, height, ceil(target_width / scale), ceil(target_height / scale))
+    if scale >= 1.0:
+        return clip, clip.size()
+    return clip, QtCore.QSize(min(clip.width(), target_width), min(clip.height(), target_height))
+
+def peak_bytes(fmt, source, decoded):
+    if fmt in DCT_SCALED_FORMATS:
+        factor = 1
+        while factor < 8 and source.width() // (factor * 2) >= decoded.width() and source.height() // (factor * 2) >= decoded.height():
+            factor *= 2
+        full = (source.width() // factor) * (source.height() // factor)
+    else:
+        full = source.width() * source.height()
+    return (full + decoded.width() * decoded.height()) * BYTES_PER_PIXEL
+
+def image_size(path):
+    reader = QtGui.QImageReader(path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if not size.isValid():
+        return None
+    if reader.transformation() & QtGui.QImageIOHandler.TransformationRotate90:
+        size = size.transposed()
+    return size.width(), size.height()
+
+def decode_image(path, target_width=None, target_height=None, mode="--zoom"):
+    reader = QtGui.QImageReader(path)
+    reader.setAutoTransform(True)
+    source = reader.size()
+    if not source.isValid():
+        raise OSError(f"Can not read image: {path}: {reader.errorString()}")
+    # Clip rect and scaled size apply to the image as stored, before rotation
+    rotated = bool(reader.transformation() & QtGui.QImageIOHandler.TransformationRotate90)
+    width, height = source.width(), source.height()
+    if rotated:
+        width, height = height, width
+    clip, size = None, QtCore.QSize(width, height)
+    if target_width and target_height:
+        # Centered regions stay centered when the image is mirrored or rotated,
+        # tiles start at the top left corner, which does not
+        if mode != "--tile" or reader.transformation() == QtGui.QImageIOHandler.TransformationNone:
+            clip, size = decode_region(width, height, target_width, target_height, mode)
+    if rotated:
+        size = size.transposed()
+        if clip is not None:
+            clip = centered(source.width(), source.height(), clip.height(), clip.width())
+    region = clip.size() if clip is not None else source
+    # Only the JPEG handler reads just the clip rect; the others decode the
+    # whole image and crop it afterwards
+    fmt = bytes(reader.format())
+    peak = peak_bytes(fmt, region if fmt in DCT_SCALED_FORMATS else source, size)
+    if peak > _memory_budget:
+        raise OSError(f"Decoding {path} needs {peak // (1024 * 1024)} MB, more than the limit of {_memory_budget // (1024 * 1024)} MB")
+    if clip is not None and clip != QtCore.QRect(QtCore.QPoint(0, 0), source):
+        reader.setClipRect(clip)
+    if size != region:
+        reader.setScaledSize(size)
+    with profiling.span("decode image"):
+        image = reader.read()
+    if image.isNull():
+        raise OSError(f"Can not read image: {path}: {reader.errorString()}")
+    return image
@@ -0,0 +1,84 @@
+import os
+import re
+import sys
+import time
+import subprocess
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor
+from engine import ConfigRecord, detect_screens
+from store import open_store
+from state import X11_SOCKETS_DIR
+from rootpixmap import get_backend, set_backend
+
+# Applies wallpapers on several X displays of one host (e.g. one per kiosk
+# seat) from a pool of processes. Screens are detected with xrandr only: the
+# Qt fallback can not be used, because a process can connect Qt to only one
+# display.
+
+X11_SOCKET_RE = re.compile(r"^X(\d+)$")
+
+def list_displays():
+    displays = []
+    try:
+        entries = os.listdir(X11_SOCKETS_DIR)
+    except OSError:
+        return displays
+    for name in entries:
+        match = X11_SOCKET_RE.match(name)
+        if match:
+            displays.append(int(match.group(1)))
+    return [f":{n}" for n in sorted(displays)]
+
+def apply_display(display, config_path, id, dry_run, render, verbose, force, backend):
+    start = time.perf_counter()
+    os.environ["DISPLAY"] = display
+    set_backend(backend)
+    config_id = None
+    command = None
+    error = None
+    try:
+        store = open_store(Namespace(config = config_path, verbose = False))
+        if id is None:
+            config = ConfigRecord.current_from_store(store, detect_screens(fallback=False))
+        else:
+            config = ConfigRecord.load(store, id)
+        if config is None:
+            error = f"no configuration with such ID: {id}"
+        else:
+            config_id = config.id
+            _, command, error = config.run(verbose, dry_run, render, force=force, capture=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        error = str(e)
+    except Exception as e:
+        # A failure on one display must not abort the report for the others
+        error = f"{type(e).__name__}: {e}"
+    return display, config_id, command, time.perf_counter() - start, error
+
+def run_apply_displays(args):
+    displays = list_displays() if args.all_displays else args.displays
+    if not displays:
+        print("No X displays found")
+        sys.exit(1)
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=min(args.jobs or os.cpu_count(), len(displays))) as pool:
+        futures = [pool.submit(apply_display, display, args.config, args.id, args.dry_run, not args.no_render, args.verbose, args.force, get_backend())
+                   for display in displays]
+        for future in futures:
+            display, config_id, command, elapsed, error = future.result()
+            if error is not None:
+                failed += 1
+                print(f"{display}: FAILED in {elapsed * 1000:.0f} ms: {error}")
+                continue
+            if command is None:
+                action = "already applied"
+            elif args.dry_run:
+                action = "checked"
+            else:
+                action = "applied"
+            print(f"{display}: {action} configuration {config_id} in {elapsed * 1000:.0f} ms")
+            if command is not None and (args.verbose or args.dry_run):
+                print(f"\t{command}")
+    print(f"{len(displays) - failed} of {len(displays)} displays done in {(time.perf_counter() - start) * 1000:.0f} ms")
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,596 @@
+import os
+import re
+import sys
+import shlex
+import subprocess
+from glob import glob
+from os.path import abspath, basename, dirname
+from hashlib import md5
+from PyQt5 import QtCore
+from render import get_render_cache, render_span
+from playlist import current_image, is_playlist
+from store import open_store
+from state import read_applied, write_applied
+from rootpixmap import get_backend, set_root_pixmap
+import profiling
+
+# This module must not import QtWidgets or QtGui at the top level: it is used
+# by `apply` and `list`, which are run from hotplug hooks and should not need
+# a display connection or the widgets stack.
+
+EDID_HEADER = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+PNP_IDS_PATHS = ["/usr/share/hwdata/pnp.ids", "/usr/share/misc/pnp.ids"]
+LISTMONITORS_RE = re.compile(r"^\s*\d+:\s+[+*]*(\S+)\s+(\d+)/\d+x(\d+)/\d+\+(-?\d+)\+(-?\d+)\s+(\S+)")
+
+def same_edid_string(a, b):
+    # Qt and our EDID parser differ in case, spacing and suffixes such as
+    # "Dell" and "DELL Inc."; strings unknown on either side match anything
+    if a.startswith("[unknown") or b.startswith("[unknown"):
+        return True
+    a = re.sub(r"[^0-9a-z]", "", a.lower())
+    b = re.sub(r"[^0-9a-z]", "", b.lower())
+    return a.startswith(b) or b.startswith(a)
+
+class ScreenRecord:
+    __slots__ = ("_name", "_manufacturer", "_model", "_serial_number", "x", "y", "width", "height", "path", "mode", "interval", "_hashkey")
+
+    def __init__(self, x, y, width, height, name, manufacturer, model, serial_number, path=None, mode=None, interval=0):
+        self.x = int(x)
+        self.y = int(y)
+        self.width = int(width)
+        self.height = int(height)
+        self._name = name or "[unnamed]"
+        self._manufacturer = manufacturer or "[unknown manufacturer]"
+        self._model = model or "[unknown model]"
+        self._serial_number = serial_number or "[unknown number]"
+        self.path = path
+        self.mode = mode or "--zoom"
+        # Seconds between slides when path is a directory or a playlist, 0 to show only the first image
+        self.interval = int(interval or 0)
+        self._hashkey = None
+
+    def name(self):
+        return self._name
+
+    def manufacturer(self):
+        return self._manufacturer
+
+    def model(self):
+        return self._model
+
+    def serialNumber(self):
+        return self._serial_number
+
+    def is_slideshow(self):
+        return self.interval > 0 and is_playlist(self.path)
+
+    def image(self, when=None):
+        return current_image(self.path, self.interval, when)
+
+    def geometry_str(self):
+        return f"{self.width}x{self.height}+{self.x}+{self.y}"
+
+    def monitor_name(self):
+        return f"{self.manufacturer()} {self.model()} SN.{self.serialNumber()} @ {self.name()}"
+
+    def tostring(self):
+        return f"{self.monitor_name()}: {self.geometry_str()}"
+
+    def for_hash(self):
+        # Geometry is formatted as repr() of the QRect returned by QScreen.geometry(),
+        # so that configuration IDs stay the same as the ones computed by Qt.
+        return f"[{self.name()}, {self.manufacturer()}, {self.model()}, {self.serialNumber()}, PyQt5.QtCore.QRect({self.x}, {self.y}, {self.width}, {self.height})]"
+
+    def hashkey(self):
+        if self._hashkey is None:
+            self._hashkey = md5(self.for_hash().encode('utf-8')).hexdigest()
+        return self._hashkey
+
+    def copy(self):
+        return ScreenRecord(self.x, self.y, self.width, self.height, self._name, self._manufacturer, self._model, self._serial_number, self.path, self.mode, self.interval)
+
+    def __repr__(self):
+        return self.tostring()
+
+class SpanRecord:
+    __slots__ = ("path", "bezel_x", "bezel_y")
+
+    def __init__(self, path, bezel_x=0, bezel_y=0):
+        self.path = path
+        self.bezel_x = int(bezel_x)
+        self.bezel_y = int(bezel_y)
+
+    def __repr__(self):
+        return f"{self.path}, bezels {self.bezel_x}x{self.bezel_y}"
+
+class ConfigRecord:
+    __slots__ = ("id", "name", "screens", "span")
+
+    def __init__(self, id="___UNKNOWN___", name="Unknown", screens=None, span=None):
+        self.id = id
+        self.name = name
+        self.screens = screens if screens is not None else []
+        self.span = span
+
+    def displayed_name(self, actual_id=None):
+        if actual_id is not None and actual_id == self.id:
+            selected = "[*] "
+        else:
+            selected = "[ ] "
+        return f"{selected}[{self.id[:8]}]: {self.name}"
+
+    @staticmethod
+    def screens_hash(screens):
+        if not screens:
+            return "___EMPTY___"
+        s = ""
+        for screen in sorted(screens, key = lambda s: s.name()):
+            s = s + screen.for_hash()
+        return md5(s.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def new(screens):
+        return ConfigRecord(ConfigRecord.screens_hash(screens), f"New: {len(screens)} monitors", [s.copy() for s in screens])
+
+    def topology(self):
+        return sorted((s.name(), s.x, s.y, s.width, s.height) for s in self.screens)
+
+    def matches(self, screens):
+        # Only differences in how EDID strings are formatted are tolerated: a
+        # different monitor on the same output is a different configuration
+        if self.topology() != sorted((s.name(), s.x, s.y, s.width, s.height) for s in screens):
+            return False
+        known = dict((s.name(), s) for s in self.screens)
+        for screen in screens:
+            other = known[screen.name()]
+            if not (same_edid_string(other.manufacturer(), screen.manufacturer())
+                    and same_edid_string(other.model(), screen.model())
+                    and same_edid_string(other.serialNumber(), screen.serialNumber())):
+                return False
+        return True
+
+    def set_mode(self, screen_key, mode):
+        for screen in self.screens:
+            if screen.hashkey() == screen_key:
+                screen.mode = mode
+                return
+
+    @staticmethod
+    def from_dict(id, data):
+        screens = [ScreenRecord(s["x"], s["y"], s["w"], s["h"], s["name"], s["manufacturer"], s["model"], s["serial_number"], s["path"], s["mode"], s.get("interval")) for s in data["screens"]]
+        span = data.get("span")
+        if span:
+            span = SpanRecord(span["path"], span["bezel_x"], span["bezel_y"])
+        return ConfigRecord(id, data["name"], screens, span)
+
+    def to_dict(self):
+        screens = []
+        for screen in self.screens:
+            screens.append(dict(x = screen.x, y = screen.y, w = screen.width, h = screen.height,
+                                name = screen.name(), manufacturer = screen.manufacturer(),
+                                model = screen.model(), serial_number = screen.serialNumber(),
+                                path = screen.path, mode = screen.mode, interval = screen.interval))
+        span = None
+        if self.span is not None:
+            span = dict(path = self.span.path, bezel_x = self.span.bezel_x, bezel_y = self.span.bezel_y)
+        return dict(name = self.name, screens = screens, span = span)
+
+    @staticmethod
+    def load(store, id):
+        data = store.get(id)
+        if data is None:
+            return None
+        return ConfigRecord.from_dict(id, data)
+
+    @staticmethod
+    def current_from_store(store, screens, verbose=False):
+        empty_config = ConfigRecord.new(screens)
+        config = ConfigRecord.load(store, empty_config.id)
+        if config is not None:
+            return config
+        # EDID strings reported by Qt and by our own parser may differ slightly,
+        # so fall back to comparing outputs by name and geometry.
+        for id in store.ids():
+            config = ConfigRecord.load(store, id)
+            if config is not None and config.matches(screens):
+                return config
+        if verbose:
+            print(f"Creating new config: {empty_config.id}")
+        return empty_config
+
+    @staticmethod
+    def list_from_store(store, current_config=None):
+        configs = []
+        ids = set()
+        for id in store.ids():
+            config = ConfigRecord.load(store, id)
+            if config is None:
+                continue
+            ids.add(id)
+            configs.append(config)
+        if current_config is not None and current_config.id not in ids:
+            configs.append(current_config)
+        return configs
+
+    def save(self, store):
+        store.put(self.id, self.to_dict())
+
+    def slideshow_screens(self):
+        if self.span is not None:
+            return []
+        return [screen for screen in self.screens if screen.is_slideshow()]
+
+    def outputs(self, render=True, verbose=False, when=None):
+        if self.span is not None:
+            try:
+                slices = render_span(self.id, self.span, self.screens)
+                return [(screen, "--center", slices[screen.hashkey()]) for screen in self.screens]
+            except OSError as e:
+                if verbose:
+                    print(f"Can not render spanned wallpaper: {e}")
+        outputs = []
+        cache = get_render_cache()
+        for screen in self.screens:
+            path = screen.image(when)
+            if not path:
+                continue
+            if render:
+                # Images rendered to the exact size of the output are displayed 1:1
+                try:
+                    outputs.append((screen, "--center", cache.get(path, screen.mode, screen.width, screen.height)))
+                    continue
+                except OSError as e:
+                    if verbose:
+                        print(f"Can not render {path} for {screen.name()}: {e}")
+            outputs.append((screen, screen.mode, path))
+        return outputs
+
+    @staticmethod
+    def arguments(outputs):
+        args = ["xwallpaper"]
+        for screen, mode, path in outputs:
+            args += ["--output", screen.name(), mode, path]
+        return args
+
+    def command(self, render=True, verbose=False, when=None):
+        outputs = self.outputs(render, verbose, when)
+        if not outputs:
+            return None
+        return shlex.join(self.arguments(outputs))
+
+    def image_paths(self, when=None):
+        paths = set(screen.image(when) for screen in self.screens)
+        if self.span is not None:
+            paths.add(self.span.path)
+        paths.discard(None)
+        return paths
+
+    def invalidate(self, changed, when=None):
+        # changed maps paths to the size and mtime they had before; rendered
+        # images of the old files are removed, slices of a spanned wallpaper
+        # are replaced by render_span itself
+        cache = get_render_cache()
+        for screen in self.screens:
+            path = screen.image(when)
+            stamp = changed.get(abspath(path)) if path else None
+            if stamp is not None:
+                cache.remove(cache.key(path, screen.mode, screen.width, screen.height, stamp))
+
+    def fingerprint(self, render=True, when=None):
+        # Only file metadata is read here, so that applying wallpapers which
+        # are already shown does not touch any image
+        parts = [self.id, str(render)]
+        files = []
+        if self.span is not None:
+            parts.append(f"span {self.span.path} {self.span.bezel_x}x{self.span.bezel_y}")
+            files.append(self.span.path)
+        for screen in sorted(self.screens, key = lambda s: s.name()):
+            path = screen.image(when)
+            parts.append(f"{screen.name()} {screen.geometry_str()} {screen.mode} {path}")
+            files.append(path)
+        for path in files:
+            try:
+                st = os.stat(path)
+                parts.append(f"{st.st_size} {st.st_mtime_ns}")
+            except (OSError, TypeError):
+                parts.append("-")
+        return md5("\n".join(parts).encode('utf-8')).hexdigest()
+
+    def apply(self, verbose=False, dry_run=False, render=True, when=None, force=False):
+        return self.run(verbose, dry_run, render, when, force)[0]
+
+    def run(self, verbose=False, dry_run=False, render=True, when=None, force=False, capture=False):
+        # Returns the exit status (None if nothing was run), the command, and
+        # the error. With capture, the command and errors are not printed, and
+        # the error output of xwallpaper is returned instead.
+        fingerprint = self.fingerprint(render, when)
+        if not force and not dry_run and fingerprint == read_applied():
+            if verbose and not capture:
+                print(f"Wallpapers of configuration {self.id} are already applied")
+            return 0, None, None
+        with profiling.span("prepare outputs"):
+            outputs = self.outputs(render, verbose, when)
+        if not outputs:
+            error = f"No wallpapers set in configuration {self.id}"
+            if verbose and not capture:
+                print(error)
+            return None, None, error
+        args = self.arguments(outputs)
+        command = shlex.join(args)
+        if (verbose or dry_run) and not capture:
+            print(command)
+        if dry_run:
+            return None, command, None
+        if get_backend() == "native":
+            try:
+                with profiling.span("set root pixmap"):
+                    set_root_pixmap(outputs)
+                write_applied(fingerprint)
+                return 0, command, None
+            except OSError as e:
+                if verbose and not capture:
+                    print(f"Can not set root pixmap, falling back to xwallpaper: {e}")
+        error = None
+        try:
+            with profiling.span("xwallpaper"):
+                if capture:
+                    result = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+                    status = result.returncode
+                    if status != 0:
+                        error = f"xwallpaper exited with status {status}: {result.stderr.strip()}"
+                else:
+                    status = subprocess.call(args)
+        except OSError as e:
+            status = 127
+            error = f"Can not run xwallpaper: {e}"
+            if not capture:
+                print(error)
+        if status == 0:
+            write_applied(fingerprint)
+        return status, command, error
+
+def preview_scale(screens, width, height):
+    max_x = max([s.x + s.width for s in screens])
+    max_y = max([s.y + s.height for s in screens])
+    scale_x = max_x / width
+    scale_y = max_y / height
+    return min(scale_x, scale_y)
+
+_pnp_ids = None
+
+def pnp_vendor(pnp_id):
+    global _pnp_ids
+    if _pnp_ids is None:
+        _pnp_ids = dict()
+        for path in PNP_IDS_PATHS:
+            try:
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    for line in f:
+                        code, _, vendor = line.rstrip("\n").partition("\t")
+                        if vendor:
+                            _pnp_ids[code] = vendor
+                break
+            except OSError:
+                continue
+    return _pnp_ids.get(pnp_id, pnp_id)
+
+def parse_edid_string(data):
+    text = data.split(b"\n")[0].decode('latin-1')
+    return "".join(c if c.isprintable() else "-" for c in text).strip()
+
+def parse_edid(blob):
+    if len(blob) < 128 or blob[:8] != EDID_HEADER:
+        return None
+    word = (blob[8] << 8) | blob[9]
+    pnp_id = "".join(chr(ord('A') - 1 + ((word >> shift) & 0x1f)) for shift in (10, 5, 0))
+    product_code = blob[10] | (blob[11] << 8)
+    serial = blob[12] | (blob[13] << 8) | (blob[14] << 16) | (blob[15] << 24)
+    product_name = ""
+    text = ""
+    serial_number = str(serial) if serial else ""
+    for i in range(4):
+        descriptor = blob[54 + i*18 : 72 + i*18]
+        if descriptor[0] or descriptor[1] or descriptor[2]:
+            continue
+        if descriptor[3] == 0xfc:
+            product_name = parse_edid_string(descriptor[5:])
+        elif descriptor[3] == 0xfe:
+            text = parse_edid_string(descriptor[5:])
+        elif descriptor[3] == 0xff:
+            serial_number = parse_edid_string(descriptor[5:])
+    model = product_name or text or f"{product_code:x}"
+    return pnp_vendor(pnp_id), model, serial_number
+
+def normalize_connector(name):
+    name = name.lower().replace("hdmi-a", "hdmi").replace("displayport", "dp")
+    return re.sub(r"[^a-z0-9]", "", name)
+
+def sysfs_edids():
+    edids = dict()
+    for path in glob("/sys/class/drm/card*-*/edid"):
+        connector = basename(dirname(path)).split("-", 1)[1]
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+        except OSError:
+            continue
+        if blob:
+            edids.setdefault(normalize_connector(connector), []).append(blob)
+    return dict((key, blobs[0]) for key, blobs in edids.items() if len(blobs) == 1)
+
+def xrandr_edids():
+    output = subprocess.run(["xrandr", "--prop"], capture_output=True, text=True, check=True).stdout
+    edids = dict()
+    current = None
+    hex_lines = None
+    for line in output.splitlines():
+        if not line.startswith((" ", "\t")):
+            current = line.split(" ", 1)[0]
+            hex_lines = None
+        elif line.strip() == "EDID:":
+            hex_lines = []
+            edids[current] = hex_lines
+        elif hex_lines is not None and line.startswith("\t\t"):
+            hex_lines.append(line.strip())
+        else:
+            hex_lines = None
+    return dict((name, bytes.fromhex("".join(lines))) for name, lines in edids.items())
+
+def xrandr_monitors():
+    output = subprocess.run(["xrandr", "--listmonitors"], capture_output=True, text=True, check=True).stdout
+    monitors = []
+    for line in output.splitlines():
+        m = LISTMONITORS_RE.match(line)
+        if not m:
+            continue
+        monitor, w, h, x, y, output_name = m.groups()
+        name = monitor if output_name == "none" else output_name
+        monitors.append((name, int(x), int(y), int(w), int(h)))
+    return monitors
+
+def screens_from_qt(qscreens):
+    screens = []
+    for s in qscreens:
+        r = s.geometry()
+        screens.append(ScreenRecord(r.x(), r.y(), r.width(), r.height(), s.name(), s.manufacturer(), s.model(), s.serialNumber()))
+    return screens
+
+class Topology(QtCore.QObject):
+    changed = QtCore.pyqtSignal()
+
+    def __init__(self, app, parent=None):
+        super().__init__(parent)
+        self.app = app
+        self._screens = None
+        self._hash = None
+        self._current_id = None
+        app.screenAdded.connect(self._on_screen_added)
+        app.screenRemoved.connect(self.invalidate)
+        for screen in app.screens():
+            screen.geometryChanged.connect(self.invalidate)
+
+    def _on_screen_added(self, screen):
+        screen.geometryChanged.connect(self.invalidate)
+        self.invalidate()
+
+    def invalidate(self, *args):
+        self._screens = None
+        self._hash = None
+        self._current_id = None
+        self.changed.emit()
+
+    def screens(self):
+        if self._screens is None:
+            with profiling.span("enumerate screens"):
+                self._screens = screens_from_qt(self.app.screens())
+        return self._screens
+
+    def hash(self):
+        if self._hash is None:
+            self._hash = ConfigRecord.screens_hash(self.screens())
+        return self._hash
+
+    def current_config(self, store, verbose=False):
+        config = ConfigRecord.current_from_store(store, self.screens(), verbose)
+        self._current_id = config.id
+        return config
+
+    def current_id(self, store):
+        if self._current_id is None:
+            self.current_config(store)
+        return self._current_id
+
+_qt_app = None
+
+def qt_screens():
+    global _qt_app
+    from PyQt5 import QtGui
+    with profiling.span("start Qt"):
+        _qt_app = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication(sys.argv)
+    return screens_from_qt(_qt_app.screens())
+
+def detect_screens(fallback=True):
+    try:
+        monitors = xrandr_monitors()
+    except (OSError, subprocess.CalledProcessError):
+        if not fallback:
+            raise
+        return qt_screens()
+    edids = sysfs_edids()
+    blobs = dict()
+    for name, _, _, _, _ in monitors:
+        blob = edids.get(normalize_connector(name))
+        if blob is not None:
+            blobs[name] = blob
+    if len(blobs) < len(monitors):
+        try:
+            blobs.update(xrandr_edids())
+        except (OSError, subprocess.CalledProcessError, ValueError):
+            pass
+    screens = []
+    for name, x, y, w, h in monitors:
+        info = parse_edid(blobs.get(name, b"")) or ("", "", "")
+        screens.append(ScreenRecord(x, y, w, h, name, *info))
+    return screens
+
+def run_apply(args):
+    with profiling.span("open store"):
+        store = open_store(args)
+    if args.id is None:
+        with profiling.span("detect screens"):
+            screens = detect_screens()
+        with profiling.span("find configuration"):
+            config = ConfigRecord.current_from_store(store, screens, args.verbose)
+    else:
+        with profiling.span("find configuration"):
+            config = ConfigRecord.load(store, args.id)
+        if config is None:
+            print(f"No configuration with such ID: {args.id}")
+            sys.exit(1)
+    status = config.apply(args.verbose, args.dry_run, not args.no_render, force=args.force)
+    if status:
+        sys.exit(status)
+
+def run_list(args):
+    with profiling.span("open store"):
+        store = open_store(args)
+    with profiling.span("detect screens"):
+        screens = detect_screens()
+    with profiling.span("read configurations"):
+        current_config = ConfigRecord.current_from_store(store, screens, args.verbose)
+        configs = ConfigRecord.list_from_store(store, current_config)
+    for config in configs:
+        if config.id == current_config.id:
+            selected = "[*] "
+        else:
+            selected = "[ ] "
+        print(f"{selected}Configuration: ID = {config.id}, name = {config.name}")
+        if config.span is not None:
+            print(f"\tSpanned wallpaper: {config.span}")
+        for screen in config.screens:
+            print(f"\t{screen.tostring()}: wallpaper {screen.path}, mode {screen.mode}")
+
+def run_span(args):
+    with profiling.span("open store"):
+        store = open_store(args)
+    if args.id is None:
+        with profiling.span("detect screens"):
+            screens = detect_screens()
+        with profiling.span("find configuration"):
+            config = ConfigRecord.current_from_store(store, screens, args.verbose)
+    else:
+        with profiling.span("find configuration"):
+            config = ConfigRecord.load(store, args.id)
+        if config is None:
+            print(f"No configuration with such ID: {args.id}")
+            sys.exit(1)
+    if args.off:
+        config.span = None
+    elif args.image:
+        bezel_x, _, bezel_y = args.bezel.partition("x")
+        config.span = SpanRecord(abspath(args.image), int(bezel_x), int(bezel_y or bezel_x))
+    else:
+        print(f"Spanned wallpaper: {config.span}")
+        return
+    config.save(store)
+    store.sync()
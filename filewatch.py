@@ -0,0 +1,78 @@
+from os.path import abspath, dirname, exists
+from PyQt5 import QtCore
+from cache import file_stamp
+
+# Watches the wallpapers of the active configuration. Scripts which regenerate
+# a wallpaper often write a new file and rename it over the old one, which
+# inotify reports as removal of the watched file, so folders of the files are
+# watched as well and files are compared by size and mtime.
+
+DEFAULT_DEBOUNCE_MS = 500
+
+def stamp_or_none(path):
+    try:
+        return file_stamp(path)
+    except OSError:
+        return None
+
+class FileWatcher(QtCore.QObject):
+    # Paths which changed, with the size and mtime they had before
+    changed = QtCore.pyqtSignal(object)
+
+    def __init__(self, parent=None, debounce=DEFAULT_DEBOUNCE_MS):
+        super().__init__(parent)
+        self.stamps = dict()
+        self.pending = dict()
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self._on_file_changed)
+        self.watcher.directoryChanged.connect(self._on_directory_changed)
+        # Files are usually written in several steps; every change restarts the timer
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounce)
+        self.timer.timeout.connect(self._on_timeout)
+
+    def watch(self, paths):
+        paths = set(abspath(path) for path in paths if path)
+        if paths == set(self.stamps.keys()):
+            return
+        self.stamps = dict((path, stamp_or_none(path)) for path in paths)
+        for path in list(self.pending.keys()):
+            if path not in paths:
+                del self.pending[path]
+        self._rewatch()
+
+    def _rewatch(self):
+        wanted = set(self.stamps.keys()) | set(dirname(path) for path in self.stamps)
+        current = set(self.watcher.files()) | set(self.watcher.directories())
+        removed = current - wanted
+        if removed:
+            self.watcher.removePaths(list(removed))
+        # Files replaced by rename are not watched anymore and have to be added again
+        added = [path for path in wanted - current if exists(path)]
+        if added:
+            self.watcher.addPaths(added)
+
+    def _on_file_changed(self, path):
+        self._check([path])
+
+    def _on_directory_changed(self, directory):
+        self._check([path for path in self.stamps if dirname(path) == directory])
+
+    def _check(self, paths):
+        for path in paths:
+            if path not in self.stamps:
+                continue
+            stamp = stamp_or_none(path)
+            if stamp == self.stamps[path]:
+                continue
+            self.pending.setdefault(path, self.stamps[path])
+            self.stamps[path] = stamp
+        self._rewatch()
+        if self.pending:
+            self.timer.start()
+
+    def _on_timeout(self):
+        changed = self.pending
+        self.pending = dict()
+        self.changed.emit(changed)
@@ -0,0 +1,224 @@
+import os
+from collections import OrderedDict
+from os.path import basename, expanduser, isdir, join, splitext
+from PyQt5 import QtCore, QtWidgets, QtGui
+from imagecache import get_thumbnail_cache
+from playlist import IMAGE_EXTENSIONS
+
+# The gallery may list tens of thousands of images. Folders are scanned in
+# small batches from the event loop, and thumbnails are generated on a thread
+# pool only when the view asks for the decoration of a row, which QListView
+# does only for rows that are visible.
+
+THUMBNAIL_WIDTH = 160
+THUMBNAIL_HEIGHT = 100
+SCAN_BATCH = 256
+MAX_PIXMAPS = 1024
+
+class ThumbnailSignals(QtCore.QObject):
+    loaded = QtCore.pyqtSignal(int, str, object)
+
+class ThumbnailTask(QtCore.QRunnable):
+    def __init__(self, model, path):
+        super().__init__()
+        self.signals = ThumbnailSignals()
+        self.signals.loaded.connect(model._on_thumbnail_loaded)
+        self.model = model
+        self.generation = model.generation
+        self.path = path
+
+    def run(self):
+        if self.generation != self.model.generation:
+            return
+        image = get_thumbnail_cache().get(self.path, THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT, keep_aspect=True)
+        self.signals.loaded.emit(self.generation, self.path, image)
+
+class GalleryModel(QtCore.QAbstractListModel):
+    PathRole = QtCore.Qt.UserRole
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.paths = []
+        self.rows = dict()
+        self.pixmaps = OrderedDict()
+        self.pending = set()
+        self.generation = 0
+        self.priority = 0
+        self.pool = QtCore.QThreadPool(self)
+        self.placeholder = QtGui.QPixmap(THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT)
+        self.placeholder.fill(QtGui.QColor("#808080"))
+        self._scan_stack = []
+        self.scan_timer = QtCore.QTimer(self)
+        self.scan_timer.timeout.connect(self._scan_batch)
+
+    def set_folder(self, folder):
+        self.cancel()
+        self.beginResetModel()
+        self.paths = []
+        self.rows = dict()
+        self.pixmaps.clear()
+        self.pending.clear()
+        self.endResetModel()
+        self._scan_stack = [folder]
+        self.scan_timer.start(0)
+
+    def cancel(self):
+        self.generation += 1
+        self.scan_timer.stop()
+        self._scan_stack = []
+        self.pool.clear()
+
+    def wait(self):
+        self.cancel()
+        self.pool.waitForDone()
+
+    def _scan_batch(self):
+        found = []
+        while self._scan_stack and len(found) < SCAN_BATCH:
+            top = self._scan_stack[-1]
+            if isinstance(top, str):
+                self._scan_stack.pop()
+                try:
+                    self._scan_stack.append(os.scandir(top))
+                except OSError:
+                    pass
+                continue
+            entry = next(top, None)
+            if entry is None:
+                top.close()
+                self._scan_stack.pop()
+                continue
+            try:
+                if entry.is_dir():
+                    if not entry.name.startswith("."):
+                        self._scan_stack.append(entry.path)
+                elif splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                    found.append(entry.path)
+            except OSError:
+                pass
+        if found:
+            first = len(self.paths)
+            self.beginInsertRows(QtCore.QModelIndex(), first, first + len(found) - 1)
+            for row, path in enumerate(found, first):
+                self.rows[path] = row
+            self.paths.extend(found)
+            self.endInsertRows()
+        if not self._scan_stack:
+            self.scan_timer.stop()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.paths)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return basename(path)
+        if role == QtCore.Qt.ToolTipRole or role == self.PathRole:
+            return path
+        if role == QtCore.Qt.DecorationRole:
+            pixmap = self.pixmaps.get(path)
+            if pixmap is not None:
+                self.pixmaps.move_to_end(path)
+                return pixmap
+            self._request(path)
+            return self.placeholder
+        return None
+
+    def _request(self, path):
+        if path in self.pending:
+            return
+        self.pending.add(path)
+        # Rows requested last are the ones visible now, so they go first
+        self.priority += 1
+        self.pool.start(ThumbnailTask(self, path), self.priority)
+
+    def _on_thumbnail_loaded(self, generation, path, image):
+        if generation != self.generation:
+            return
+        self.pending.discard(path)
+        if image.isNull():
+            return
+        self.pixmaps[path] = QtGui.QPixmap.fromImage(image)
+        while len(self.pixmaps) > MAX_PIXMAPS:
+            self.pixmaps.popitem(last=False)
+        row = self.rows.get(path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [QtCore.Qt.DecorationRole])
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid():
+            flags |= QtCore.Qt.ItemIsDragEnabled
+        return flags
+
+    def mimeTypes(self):
+        return ["text/uri-list"]
+
+    def mimeData(self, indexes):
+        data = QtCore.QMimeData()
+        data.setUrls([QtCore.QUrl.fromLocalFile(self.paths[index.row()]) for index in indexes])
+        return data
+
+class GalleryDock(QtWidgets.QDockWidget):
+    imageActivated = QtCore.pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__("Gallery", parent)
+        self.settings = QtCore.QSettings("xwallpapergui", "gallery")
+        self.model = GalleryModel(self)
+        widget = QtWidgets.QWidget(self)
+        layout = QtWidgets.QVBoxLayout()
+        widget.setLayout(layout)
+
+        folder_layout = QtWidgets.QHBoxLayout()
+        self.folder_label = QtWidgets.QLabel(self)
+        folder_layout.addWidget(self.folder_label, True)
+        folder_button = QtWidgets.QPushButton("Folder...", self)
+        folder_button.clicked.connect(self._on_browse_folder)
+        folder_layout.addWidget(folder_button, False)
+        layout.addLayout(folder_layout)
+
+        self.view = QtWidgets.QListView(self)
+        self.view.setViewMode(QtWidgets.QListView.IconMode)
+        self.view.setResizeMode(QtWidgets.QListView.Adjust)
+        self.view.setMovement(QtWidgets.QListView.Static)
+        self.view.setUniformItemSizes(True)
+        self.view.setLayoutMode(QtWidgets.QListView.Batched)
+        self.view.setBatchSize(SCAN_BATCH)
+        self.view.setIconSize(QtCore.QSize(THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT))
+        self.view.setGridSize(QtCore.QSize(THUMBNAIL_WIDTH + 16, THUMBNAIL_HEIGHT + 32))
+        self.view.setDragEnabled(True)
+        self.view.setDragDropMode(QtWidgets.QAbstractItemView.DragOnly)
+        self.view.setModel(self.model)
+        self.view.activated.connect(self._on_activated)
+        layout.addWidget(self.view, True)
+        self.setWidget(widget)
+
+        # Without a folder chosen, only ~/Pictures is scanned: the home
+        # directory is full of images which are not wallpapers
+        folder = self.settings.value("folder")
+        if not folder or not isdir(folder):
+            folder = join(expanduser("~"), "Pictures")
+        if isdir(folder):
+            self.set_folder(folder)
+        else:
+            self.folder_label.setText("<b>Folder</b>: none")
+
+    def set_folder(self, folder):
+        self.folder_label.setText(f"<b>Folder</b>: {folder}")
+        self.model.set_folder(folder)
+
+    def _on_browse_folder(self):
+        folder = QtWidgets.QFileDialog.getExistingDirectory(self, "Select folder with wallpapers", self.settings.value("folder", "."))
+        if not folder:
+            return
+        self.settings.setValue("folder", folder)
+        self.set_folder(folder)
+
+    def _on_activated(self, index):
+        self.imageActivated.emit(self.model.data(index, GalleryModel.PathRole))
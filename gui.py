@@ -0,0 +1,758 @@
+import sys
+from math import ceil
+from collections import OrderedDict
+from os.path import abspath, basename
+from PyQt5 import QtCore, QtWidgets, QtGui
+from imagecache import get_thumbnail_cache, get_mip_cache, get_preview_cache, MIP_LEVELS
+from render import compose
+from gallery import GalleryDock
+from filewatch import FileWatcher, stamp_or_none
+from library import get_library, autofill_new
+from engine import preview_scale, ConfigRecord, Topology
+from store import open_store
+import profiling
+
+SCENE_CACHE_SIZE = 4
+SAVE_DELAY_MS = 1000
+RESIZE_DELAY_MS = 150
+
+class ScreensScene(QtWidgets.QGraphicsScene):
+    screenClicked = QtCore.pyqtSignal(object)
+    screenDoubleClicked = QtCore.pyqtSignal(object)
+    sceneClicked = QtCore.pyqtSignal()
+    imageDropped = QtCore.pyqtSignal(object, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.screen_items = dict()
+        self.text_items = dict()
+
+class ScreensView(QtWidgets.QGraphicsView):
+    resized = QtCore.pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+
+    def fit(self):
+        if self.scene() is not None:
+            self.fitInView(self.scene().sceneRect(), QtCore.Qt.KeepAspectRatio)
+
+    def resizeEvent(self, ev):
+        super().resizeEvent(ev)
+        self.fit()
+        self.resized.emit()
+
+    def mousePressEvent(self, ev):
+        super().mousePressEvent(ev)
+        ev.ignore()
+
+    def mouseReleaseEvent(self, ev):
+        super().mouseReleaseEvent(ev)
+        self.scene().sceneClicked.emit()
+        ev.ignore()
+        #self.scene().screenClicked.emit(self)
+
+class ScreenMock:
+    def __init__(self, geometry, name, manufacturer, model, serial_number):
+        self._geometry = geometry
+        self._name = name
+        self._manufacturer = manufacturer
+        self._model = model
+        self._serial_number = serial_number
+
+    def name(self):
+        return self._name
+    
+    def manufacturer(self):
+        return self._manufacturer
+    
+    def model(self):
+        return self._model
+    
+    def geometry(self):
+        return self._geometry
+
+    def serialNumber(self):
+        return self._serial_number
+
+class ScreenItem(QtWidgets.QGraphicsPixmapItem):
+    def __init__(self, scale, record, parent=None):
+        rect = QtCore.QRectF(record.x, record.y, record.width, record.height)
+        self.scale = scale
+        self.orig_rect = rect
+        self.record = record
+        # Previews are drawn for the size of the item on the display, and are
+        # scaled down to the size of the item in the scene
+        self.preview_key = None
+        self.requested = None
+        # Key of the shared preview in the preview cache
+        self.cache_key = None
+        self.scaled_rect = QtCore.QRectF(rect.x() / scale, rect.y() / scale, rect.width() / scale, rect.height() / scale) 
+        self.pixel_size = self.preview_size()
+        pixmap = self._make_pixmap(record.path)
+        super().__init__(pixmap, parent)
+        self.setPos(int(self.scaled_rect.x()), int(self.scaled_rect.y()))
+        self.setFlags(QtWidgets.QGraphicsItem.ItemIsFocusable | QtWidgets.QGraphicsItem.ItemIsSelectable)
+        self.setAcceptDrops(True)
+
+    def name(self):
+        return self.record.name()
+    
+    def manufacturer(self):
+        return self.record.manufacturer()
+    
+    def model(self):
+        return self.record.model()
+
+    def serialNumber(self):
+        return self.record.serialNumber()
+
+    def preview_size(self):
+        return int(self.scaled_rect.width()), int(self.scaled_rect.height())
+
+    def _make_pixmap(self, path):
+        pixmap = QtGui.QPixmap(*self.preview_size())
+        if path:
+            pixmap.fill(QtGui.QColor("#808080"))
+        else:
+            pixmap.fill(QtGui.QColor("#00ff00"))
+        return pixmap
+
+    def reset_preview(self):
+        # The old preview stays until the new one is drawn
+        self.preview_key = None
+        self.requested = None
+
+    def wanted_preview_key(self):
+        # The size and mtime of the file are part of the key, so that previews
+        # of files replaced while another configuration was shown are redrawn
+        image_path = self.record.image()
+        stamp = stamp_or_none(image_path) if image_path else None
+        return (self.record.path, stamp, self.record.mode) + tuple(self.pixel_size)
+
+    def set_preview(self, pixmap, key, cache_key):
+        cache = get_preview_cache()
+        cache.acquire(cache_key)
+        self.release_preview()
+        self.cache_key = cache_key
+        width, height = self.preview_size()
+        self.setPixmap(pixmap)
+        self.setTransform(QtGui.QTransform.fromScale(width / pixmap.width(), height / pixmap.height()))
+        self.preview_key = key
+
+    def release_preview(self):
+        if self.cache_key is not None:
+            get_preview_cache().release(self.cache_key)
+            self.cache_key = None
+
+    @property
+    def path(self):
+        return self.record.path
+    
+    @path.setter
+    def path(self, path):
+        self.record.path = path
+        self.preview_key = None
+        self.requested = None
+        self.release_preview()
+        pixmap = self._make_pixmap(path)
+        self.setPixmap(pixmap)
+        self.setTransform(QtGui.QTransform())
+
+    @property
+    def mode(self):
+        return self.record.mode
+
+    @mode.setter
+    def mode(self, mode):
+        self.record.mode = mode
+
+    @property
+    def interval(self):
+        return self.record.interval
+
+    @interval.setter
+    def interval(self, interval):
+        self.record.interval = interval
+
+    def rect(self):
+        return self.scaled_rect
+
+    def geometry(self):
+        return self.orig_rect
+
+    def geometry_str(self):
+        return self.record.geometry_str()
+    
+    def monitor_name(self):
+        return self.record.monitor_name()
+
+    def tostring(self):
+        return self.record.tostring()
+
+    def for_hash(self):
+        return self.record.for_hash()
+
+    def hashkey(self):
+        return self.record.hashkey()
+    
+    def __repr__(self):
+        return self.tostring()
+
+    def mousePressEvent(self, ev):
+        super().mousePressEvent(ev)
+        ev.accept()
+
+    def mouseReleaseEvent(self, ev):
+        self.scene().screenClicked.emit(self)
+
+    def mouseDoubleClickEvent(self, ev):
+        self.scene().screenDoubleClicked.emit(self)
+
+    def dropEvent(self, ev):
+        data = ev.mimeData()
+        if data.hasUrls():
+            path = data.urls()[0].toLocalFile()
+        elif data.hasText():
+            path = data.text()
+        if not path:
+            return
+        prefix = "file://"
+        prefix_len = len(prefix)
+        if path.startswith(prefix):
+            path = path[prefix_len:]
+        self.scene().imageDropped.emit(self, path)
+
+def preview_image(path, mode, width, height, screen_width, screen_height):
+    cache = get_mip_cache()
+    size = cache.size(path)
+    if size is None:
+        return QtGui.QImage()
+    image_width, image_height = size
+    # Scale of the image in the preview decides which level of the pyramid is needed
+    if mode in ("--center", "--tile"):
+        scale = width / screen_width
+    elif mode == "--maximize":
+        scale = min(width / image_width, height / image_height)
+    else:
+        scale = max(width / image_width, height / image_height)
+    level = cache.get(path, ceil(max(image_width, image_height) * scale))
+    if level.isNull():
+        return level
+    return compose(level, mode, width, height, scale * image_width / level.width())
+
+class PreviewSignals(QtCore.QObject):
+    loaded = QtCore.pyqtSignal(int, object, object)
+
+class PreviewTask(QtCore.QRunnable):
+    def __init__(self, loader, generation, cache_key):
+        super().__init__()
+        self.signals = PreviewSignals()
+        self.signals.loaded.connect(loader._on_loaded)
+        self.loader = loader
+        self.generation = generation
+        self.cache_key = cache_key
+
+    def run(self):
+        if self.generation != self.loader.generation:
+            return
+        image_path, _, mode, width, height, screen_width, screen_height = self.cache_key
+        image = preview_image(image_path, mode, width, height, screen_width, screen_height)
+        self.signals.loaded.emit(self.generation, self.cache_key, image)
+
+class PreviewLoader(QtCore.QObject):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QtCore.QThreadPool(self)
+        self.generation = 0
+        # Screens waiting for each preview being drawn, so that screens
+        # showing the same preview share one task
+        self.waiting = dict()
+
+    def request(self, screen_item):
+        key = screen_item.wanted_preview_key()
+        if not screen_item.path or screen_item.preview_key == key:
+            return
+        _, stamp, mode, width, height = key
+        if stamp is None:
+            return
+        # Slideshows are previewed with their current slide
+        image_path = screen_item.record.image()
+        record = screen_item.record
+        cache_key = (image_path, stamp, mode, width, height, record.width, record.height)
+        pixmap = get_preview_cache().get(cache_key)
+        if pixmap is not None:
+            screen_item.set_preview(pixmap, key, cache_key)
+            return
+        requested = (self.generation, key)
+        if screen_item.requested == requested:
+            return
+        screen_item.requested = requested
+        waiting = self.waiting.get(cache_key)
+        if waiting is not None:
+            waiting.append((screen_item, key))
+            return
+        self.waiting[cache_key] = [(screen_item, key)]
+        self.pool.start(PreviewTask(self, self.generation, cache_key))
+
+    def cancel(self):
+        self.generation += 1
+        self.pool.clear()
+        self.waiting.clear()
+
+    def wait(self):
+        self.cancel()
+        self.pool.waitForDone()
+
+    def _on_loaded(self, generation, cache_key, image):
+        if generation != self.generation:
+            return
+        waiting = self.waiting.pop(cache_key, [])
+        if image.isNull():
+            return
+        pixmap = get_preview_cache().insert(cache_key, image)
+        for screen_item, key in waiting:
+            if screen_item.wanted_preview_key() == key:
+                screen_item.set_preview(pixmap, key, cache_key)
+
+def thumbnail_jobs(store):
+    # The level the GUI needs depends on the size of its window, but every
+    # level can be made from the largest one
+    level = MIP_LEVELS[-1]
+    jobs = []
+    for config in ConfigRecord.list_from_store(store):
+        for screen in config.screens:
+            path = screen.image()
+            if path:
+                jobs.append((path, level, level, True))
+    return jobs
+
+class GUI(QtWidgets.QMainWindow):
+    def __init__(self, args):
+        super().__init__()
+        self.store = open_store(args)
+        self.verbose = args.verbose
+        # Changes are written to the store at once, but the store is written
+        # to disk only after SAVE_DELAY_MS without further changes
+        self.save_timer = QtCore.QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(SAVE_DELAY_MS)
+        self.save_timer.timeout.connect(self._flush_settings)
+        # Scenes of recently shown configurations, most recent last
+        self.scenes = OrderedDict()
+        self.scene = None
+        self.graphics_view = ScreensView(self)
+        self.resize_timer = QtCore.QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(RESIZE_DELAY_MS)
+        self.resize_timer.timeout.connect(self._update_previews)
+        self.graphics_view.resized.connect(self.resize_timer.start)
+        self.main_widget = QtWidgets.QWidget(self)
+        self.selected_screen_key = None
+        self.topology = Topology(QtWidgets.QApplication.instance(), self)
+        self.setCentralWidget(self.main_widget)
+        layout = QtWidgets.QVBoxLayout()
+        self.main_widget.setLayout(layout)
+        topbar = QtWidgets.QWidget(self)
+        topbar_layout = QtWidgets.QHBoxLayout()
+        topbar.setLayout(topbar_layout)
+
+        label = QtWidgets.QLabel("Configuration:", self)
+        topbar_layout.addWidget(label)
+        self.current_config_combo = QtWidgets.QComboBox(self)
+        self.config_names = dict()
+        current_config = self.get_current_config()
+        for cfg in ConfigRecord.list_from_store(self.store, current_config):
+            self.config_names[cfg.id] = cfg.name
+            self.current_config_combo.addItem(cfg.displayed_name(current_config.id), cfg.id)
+        topbar_layout.addWidget(self.current_config_combo, True)
+
+        rename_button = QtWidgets.QPushButton("Rename", self)
+        rename_button.clicked.connect(self._on_rename_config)
+        topbar_layout.addWidget(rename_button)
+
+        autofill_button = QtWidgets.QPushButton("Auto-fill", self)
+        autofill_button.setToolTip("Set wallpapers from the library which fit each monitor best")
+        autofill_button.clicked.connect(self._on_autofill)
+        topbar_layout.addWidget(autofill_button)
+
+        layout.addWidget(topbar)
+        layout.addWidget(self.graphics_view, True)
+
+        self.bottombar = QtWidgets.QWidget(self)
+        bottombar_layout = QtWidgets.QVBoxLayout()
+        self.bottombar.setLayout(bottombar_layout)
+        self.selected_screen_label = QtWidgets.QLabel(self)
+        bottombar_layout.addWidget(self.selected_screen_label)
+
+        path_layout = QtWidgets.QHBoxLayout()
+        self.path_label = QtWidgets.QLabel(self)
+        path_layout.addWidget(self.path_label, False, QtCore.Qt.AlignLeft)
+
+        self.browse_button = QtWidgets.QPushButton("Browse...", self)
+        self.browse_button.clicked.connect(self._on_browse_selected)
+        self.folder_button = QtWidgets.QPushButton("Folder...", self)
+        self.folder_button.clicked.connect(self._on_browse_folder)
+        self.copy_button = QtWidgets.QPushButton("Copy", self)
+        self.copy_button.clicked.connect(self._on_copy_path)
+        self.paste_button = QtWidgets.QPushButton("Paste", self)
+        self.paste_button.clicked.connect(self._on_paste_path)
+        path_layout.addWidget(self.browse_button, False, QtCore.Qt.AlignLeft)
+        path_layout.addWidget(self.folder_button, False, QtCore.Qt.AlignLeft)
+        path_layout.addWidget(self.copy_button, False, QtCore.Qt.AlignLeft)
+        path_layout.addWidget(self.paste_button, False, QtCore.Qt.AlignLeft)
+        path_layout.addStretch()
+
+        bottombar_layout.addLayout(path_layout)
+
+        mode_layout = QtWidgets.QHBoxLayout()
+        mode_label = QtWidgets.QLabel("<b>Mode</b>:", self)
+        mode_layout.addWidget(mode_label, False, QtCore.Qt.AlignLeft)
+
+        self.mode_combo = QtWidgets.QComboBox(self)
+        self.mode_combo.addItem("Maximize", "--maximize")
+        self.mode_combo.addItem("Stretch", "--stretch")
+        self.mode_combo.addItem("Zoom", "--zoom")
+        self.mode_combo.addItem("Tile", "--tile")
+        self.mode_combo.addItem("Center", "--center")
+        self.mode_combo.setCurrentIndex(0)
+        self.mode_combo.currentIndexChanged.connect(self._on_select_mode)
+        self.mode_combo.setEnabled(False)
+        mode_layout.addWidget(self.mode_combo, False, QtCore.Qt.AlignLeft)
+
+        interval_label = QtWidgets.QLabel("<b>Change every</b>:", self)
+        mode_layout.addWidget(interval_label, False, QtCore.Qt.AlignLeft)
+        self.interval_spin = QtWidgets.QSpinBox(self)
+        self.interval_spin.setRange(0, 24 * 60)
+        self.interval_spin.setSuffix(" min")
+        self.interval_spin.setSpecialValueText("Never")
+        self.interval_spin.valueChanged.connect(self._on_select_interval)
+        mode_layout.addWidget(self.interval_spin, False, QtCore.Qt.AlignLeft)
+        mode_layout.addStretch()
+        self._enable_set_path(False)
+
+        bottombar_layout.addLayout(mode_layout)
+
+        apply_button = QtWidgets.QPushButton("Apply", self)
+        bottombar_layout.addWidget(apply_button, False, QtCore.Qt.AlignRight)
+        apply_button.clicked.connect(self._on_apply)
+        layout.addWidget(self.bottombar)
+
+        self.preview_loader = PreviewLoader(self)
+        self.file_watcher = FileWatcher(self)
+        self.file_watcher.changed.connect(self._on_files_changed)
+
+        self.gallery = GalleryDock(self)
+        self.gallery.imageActivated.connect(self._on_gallery_activated)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.gallery)
+
+        self.load_config(current_config)
+        self._set_selected_config(self.selected_config)
+
+        self._mask_select_mode = False
+
+        self.current_config_combo.currentIndexChanged.connect(self._on_select_config)
+        self.topology.changed.connect(self._on_topology_changed)
+
+    def _enable_set_path(self, value):
+        self.browse_button.setEnabled(value)
+        self.folder_button.setEnabled(value)
+        self.interval_spin.setEnabled(value)
+        self.copy_button.setEnabled(value)
+        self.paste_button.setEnabled(value)
+
+    def _save_settings(self):
+        self.selected_config.save(self.store)
+        self.save_timer.start()
+
+    def _flush_settings(self):
+        self.save_timer.stop()
+        self.store.sync()
+
+    def closeEvent(self, ev):
+        self.preview_loader.wait()
+        self.gallery.model.wait()
+        self.selected_config.save(self.store)
+        self._flush_settings()
+        if self.verbose:
+            print(f"Preview cache: {get_preview_cache().stats()}")
+            print(f"Image pyramid cache: {get_mip_cache().stats()}")
+        ev.accept()
+
+    def _on_select_image(self, path):
+        if not path:
+            return
+        key = self.selected_screen_key
+        #print(f"{key} :=> {path}")
+        self.screen_items[key].path = path
+        self.preview_loader.request(self.screen_items[key])
+        self.text_items[key].setPlainText(f"{self.screen_items[key].name()}: {basename(path)}")
+        self.file_watcher.watch(self.selected_config.image_paths())
+        self._save_settings()
+
+    def _on_browse_selected(self, button):
+        if self.selected_screen_key is None:
+            return
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Select file", ".", "Image files (*.jpg *.png *.png);;Playlists (*.m3u *.m3u8 *.lst *.txt)")
+        self._on_select_image(path)
+
+    def _on_browse_folder(self, button):
+        if self.selected_screen_key is None:
+            return
+        path = QtWidgets.QFileDialog.getExistingDirectory(self, "Select folder of images for slideshow", ".")
+        self._on_select_image(path)
+        self._show_path(path)
+
+    def _on_browse_screen(self, screen_item):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Select file", ".", "Image files (*.jpg *.png *.png)")
+        self.selected_screen_key = screen_item.hashkey()
+        self._on_select_image(path)
+
+    def _on_image_dropped(self, screen_item, path):
+        self.selected_screen_key = screen_item.hashkey()
+        self._on_select_image(path)
+        self._display_selected_screen(screen_item)
+
+    def _on_gallery_activated(self, path):
+        if self.selected_screen_key is None:
+            return
+        self._on_select_image(path)
+        self._show_path(path)
+
+    def _on_copy_path(self, button):
+        if self.selected_screen_key is None:
+            return
+        path = self.screen_items[self.selected_screen_key].path
+        QtWidgets.QApplication.clipboard().setText(path)
+
+    def _on_paste_path(self, button):
+        if self.selected_screen_key is None:
+            return
+        path = QtWidgets.QApplication.clipboard().text()
+        self._on_select_image(path)
+        self._show_path(path)
+
+    def _on_apply(self, button):
+        # Let the daemon and `apply` see what is shown
+        self.selected_config.save(self.store)
+        self._flush_settings()
+        self.selected_config.apply(self.verbose, force=True)
+
+    def _on_select_mode(self):
+        if self._mask_select_mode:
+            return
+        mode = self.mode_combo.currentData()
+        self.selected_config.set_mode(self.selected_screen_key, mode)
+        #print("Selected", mode)
+        self.preview_loader.request(self.screen_items[self.selected_screen_key])
+        self._save_settings()
+
+    def _on_select_interval(self, minutes):
+        if self._mask_select_mode or self.selected_screen_key is None:
+            return
+        self.screen_items[self.selected_screen_key].interval = minutes * 60
+        self._save_settings()
+
+    def _on_rename_config(self):
+        new_name, ok = QtWidgets.QInputDialog.getText(self, "New configuration name", "New name:", QtWidgets.QLineEdit.Normal, self.selected_config.name)
+        if ok and new_name:
+            self.selected_config.name = new_name
+            cfg_idx = self.current_config_combo.findData(self.selected_config.id)
+            self.config_names[self.selected_config.id] = new_name
+            actual_id = self.topology.current_id(self.store)
+            self.current_config_combo.setItemText(cfg_idx, self.selected_config.displayed_name(actual_id))
+        self._save_settings()
+
+    def _on_autofill(self):
+        library = get_library()
+        if not library.images:
+            QtWidgets.QMessageBox.information(self, "Auto-fill", "The library is empty. Add folders with wallpapers to it with:\n\nxwallpapergui.py library add FOLDER")
+            return
+        library.autofill(self.selected_config, overwrite=True)
+        self._save_settings()
+        self.load_config(self.selected_config)
+
+    def _set_selected_config(self, cfg):
+        cfg_idx = self.current_config_combo.findData(cfg.id)
+        self.current_config_combo.setCurrentIndex(cfg_idx)
+
+    def _set_selected_mode(self, mode):
+        self._mask_select_mode = True
+        mode_idx = self.mode_combo.findData(mode)
+        self.mode_combo.setCurrentIndex(mode_idx)
+        self._mask_select_mode = False
+
+    def _set_selected_interval(self, interval):
+        self._mask_select_mode = True
+        self.interval_spin.setValue(interval // 60)
+        self._mask_select_mode = False
+
+    def _on_select_config(self, src):
+        self._save_settings()
+        cfg_id = self.current_config_combo.currentData()
+        config = ConfigRecord.load(self.store, cfg_id)
+        if config is None:
+            config = self.get_current_config()
+        self.load_config(config)
+
+    def get_current_config(self):
+        config = self.topology.current_config(self.store, self.verbose)
+        # New configurations start with the wallpapers of the library which fit best
+        if self.store.get(config.id) is None and autofill_new(config):
+            config.save(self.store)
+            self.save_timer.start()
+        return config
+
+    def _on_topology_changed(self):
+        current_config = self.get_current_config()
+        if self.current_config_combo.findData(current_config.id) < 0:
+            self.config_names[current_config.id] = current_config.name
+            self.current_config_combo.addItem(current_config.displayed_name(current_config.id), current_config.id)
+        for cfg_idx in range(self.current_config_combo.count()):
+            cfg_id = self.current_config_combo.itemData(cfg_idx)
+            cfg = ConfigRecord(cfg_id, self.config_names[cfg_id])
+            self.current_config_combo.setItemText(cfg_idx, cfg.displayed_name(current_config.id))
+    
+    def _make_scene(self):
+        scene = ScreensScene(self)
+        scene.screenClicked.connect(self._on_screen_clicked)
+        scene.sceneClicked.connect(self._on_scene_clicked)
+        scene.screenDoubleClicked.connect(self._on_browse_screen)
+        scene.imageDropped.connect(self._on_image_dropped)
+        return scene
+
+    def _get_scene(self, config_id):
+        scene = self.scenes.pop(config_id, None)
+        if scene is None:
+            if len(self.scenes) < SCENE_CACHE_SIZE:
+                scene = self._make_scene()
+            else:
+                # Recycle the least recently shown scene; items of screens
+                # which are in both configurations are kept
+                _, scene = self.scenes.popitem(last=False)
+        self.scenes[config_id] = scene
+        return scene
+
+    def _update_scene(self, scene, config):
+        scale = preview_scale(config.screens, 320, 200) if config.screens else 1.0
+        screen_items = scene.screen_items
+        text_items = scene.text_items
+        keys = set()
+        for record in config.screens:
+            key = record.hashkey()
+            keys.add(key)
+            screen_item = screen_items.get(key)
+            if screen_item is not None and screen_item.scale == scale:
+                screen_item.record = record
+                if screen_item.preview_key is not None and screen_item.preview_key[0] != record.path:
+                    screen_item.path = record.path
+            else:
+                if screen_item is not None:
+                    screen_item.release_preview()
+                    scene.removeItem(screen_item)
+                    scene.removeItem(text_items.pop(key))
+                screen_item = ScreenItem(scale, record)
+                scene.addItem(screen_item)
+                screen_items[key] = screen_item
+                text_item = scene.addText("")
+                text_item.setFlag(QtWidgets.QGraphicsItem.ItemIgnoresTransformations)
+                text_item.setPos(screen_item.rect().topLeft())
+                text_items[key] = text_item
+            if screen_item.path is None:
+                text = f"{screen_item.name()}: <Not set>"
+            else:
+                text = f"{screen_item.name()}: {basename(screen_item.path)}"
+            text_items[key].setPlainText(text)
+        for key in set(screen_items.keys()) - keys:
+            screen_item = screen_items.pop(key)
+            screen_item.release_preview()
+            scene.removeItem(screen_item)
+            scene.removeItem(text_items.pop(key))
+        rect = QtCore.QRectF()
+        for screen_item in screen_items.values():
+            rect = rect.united(screen_item.rect())
+        scene.setSceneRect(rect)
+
+    def _update_previews(self):
+        # Previews follow the size of the screens on the display
+        zoom = self.graphics_view.transform().m11() * self.graphics_view.devicePixelRatioF()
+        if zoom <= 0:
+            zoom = 1.0
+        for screen_item in self.screen_items.values():
+            width, height = screen_item.preview_size()
+            screen_item.pixel_size = (max(1, round(width * zoom)), max(1, round(height * zoom)))
+            self.preview_loader.request(screen_item)
+
+    def load_config(self, config):
+        self.preview_loader.cancel()
+        self.selected_config = config
+        scene = self._get_scene(config.id)
+        self._update_scene(scene, config)
+        scene.clearSelection()
+        self.scene = scene
+        self.screen_items = scene.screen_items
+        self.text_items = scene.text_items
+        if self.graphics_view.scene() is not scene:
+            self.graphics_view.setScene(scene)
+        self.graphics_view.fit()
+        self._update_previews()
+        self.file_watcher.watch(config.image_paths())
+        self.selected_screen_key = None
+        self.mode_combo.setEnabled(False)
+        self._enable_set_path(False)
+
+    def _on_files_changed(self, changed):
+        # Wallpapers were replaced on disk: only their previews and rendered
+        # images are dropped
+        self.selected_config.invalidate(changed)
+        cache = get_mip_cache()
+        for screen_item in self.screen_items.values():
+            path = screen_item.record.image()
+            if path and abspath(path) in changed:
+                cache.invalidate(path, changed[abspath(path)])
+                screen_item.reset_preview()
+                self.preview_loader.request(screen_item)
+
+    def _show_path(self, path):
+        self.path_label.setText(f"<b>Wallpaper</b>: {path}")
+
+    def _display_selected_screen(self, screen_item):
+        text = f"""<b>Selected screen</b>: geometry: {screen_item.geometry_str()}.<br>
+        <b>Monitor</b>: {screen_item.monitor_name()}"""
+        self.selected_screen_label.setText(text)
+        self._show_path(screen_item.path)
+
+    def _on_screen_clicked(self, screen_item):
+        self._display_selected_screen(screen_item)
+        self.selected_screen_key = screen_item.hashkey()
+        #print(f"Screen clicked: {screen_item.name()}, {screen_item.path}, {screen_item.mode}")
+        self._set_selected_mode(screen_item.mode)
+        self._set_selected_interval(screen_item.interval)
+        self.mode_combo.setEnabled(True)
+        self._enable_set_path(True)
+
+    def _on_scene_clicked(self):
+        selected = self.scene.selectedItems()
+        if not selected:
+            self.selected_screen_label.setText("")
+            self.mode_combo.setEnabled(False)
+            self.browse_button.setEnabled(False)
+            self.selected_screen_key = None
+
+def launch_gui(args):
+    with profiling.span("start Qt"):
+        app = QtWidgets.QApplication(sys.argv)
+    with profiling.span("create window"):
+        win = GUI(args)
+    win.show()
+    sys.exit(app.exec_())
+
+def warm_thumbnails(args):
+    app = QtCore.QCoreApplication(sys.argv)
+    store = open_store(args)
+    cache = get_thumbnail_cache()
+    n_thumbnails = cache.warm(thumbnail_jobs(store), args.jobs)
+    if args.verbose:
+        print(f"Generated {n_thumbnails} thumbnails in {cache.directory}")
@@ -0,0 +1,270 @@
+import os
+import threading
+from collections import OrderedDict
+from os.path import join
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5 import QtCore, QtGui
+from cache import FileCache, get_cache_dir, file_key
+from decode import decode_image, image_size
+import profiling
+
+DEFAULT_THUMBNAIL_CACHE_SIZE = 128 * 1024 * 1024
+
+class ThumbnailCache(FileCache):
+    def __init__(self, directory=None, max_bytes=DEFAULT_THUMBNAIL_CACHE_SIZE):
+        if directory is None:
+            directory = join(get_cache_dir(), "thumbnails")
+        super().__init__(directory, max_bytes)
+
+    @staticmethod
+    def key(path, width, height, keep_aspect=False, stamp=None):
+        if keep_aspect:
+            return file_key(path, f"{width}x{height}", "keep", stamp=stamp)
+        return file_key(path, f"{width}x{height}", stamp=stamp)
+
+    def cached(self, path, width, height, keep_aspect=False):
+        # Returns a null image if the thumbnail is not in the cache
+        try:
+            key = self.key(path, max(1, int(width)), max(1, int(height)), keep_aspect)
+        except OSError:
+            return QtGui.QImage()
+        cached = self.lookup(key)
+        if cached is None:
+            return QtGui.QImage()
+        with profiling.span("read thumbnail"):
+            return QtGui.QImage(cached)
+
+    def get(self, path, width, height, keep_aspect=False):
+        width = max(1, int(width))
+        height = max(1, int(height))
+        image = self.cached(path, width, height, keep_aspect)
+        if not image.isNull():
+            return image
+        try:
+            key = self.key(path, width, height, keep_aspect)
+        except OSError:
+            return QtGui.QImage()
+        try:
+            image = decode_image(path, width, height, "--maximize" if keep_aspect else "--stretch")
+        except OSError:
+            return QtGui.QImage()
+        with profiling.span("scale thumbnail"):
+            aspect = QtCore.Qt.KeepAspectRatio if keep_aspect else QtCore.Qt.IgnoreAspectRatio
+            image = image.scaled(width, height, aspect, QtCore.Qt.SmoothTransformation)
+        self.store(key, image)
+        return image
+
+    def warm(self, jobs, workers=None):
+        jobs = set(jobs)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            images = list(pool.map(lambda job: self.get(*job), jobs))
+        self.evict()
+        return sum(1 for image in images if not image.isNull())
+
+_thumbnail_cache = None
+
+def get_thumbnail_cache():
+    global _thumbnail_cache
+    if _thumbnail_cache is None:
+        _thumbnail_cache = ThumbnailCache()
+    return _thumbnail_cache
+
+# Previews are drawn from a pyramid of downscaled copies of each image, kept in
+# memory, so that resizing the window only picks another level. Missing levels
+# are made from a larger level if there is one, otherwise they are read from
+# the thumbnail cache, and only then decoded from the image file.
+
+MIP_LEVELS = [256, 512, 1024, 2048]
+DEFAULT_MIP_CACHE_SIZE = 256 * 1024 * 1024
+
+class MipCache:
+    def __init__(self, thumbnails=None, max_bytes=DEFAULT_MIP_CACHE_SIZE):
+        self.thumbnails = thumbnails or get_thumbnail_cache()
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def level_for(size):
+        for level in MIP_LEVELS:
+            if level >= size:
+                return level
+        return MIP_LEVELS[-1]
+
+    def _entry(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry["stamp"] == stamp:
+                self.entries.move_to_end(path)
+                return entry
+        size = image_size(path)
+        if size is None:
+            return None
+        entry = dict(stamp = stamp, size = size, levels = dict())
+        with self._lock:
+            old = self.entries.pop(path, None)
+            if old is not None:
+                self.bytes -= sum(image.sizeInBytes() for image in old["levels"].values())
+            self.entries[path] = entry
+        return entry
+
+    def _add(self, path, entry, level, image):
+        with self._lock:
+            if level in entry["levels"]:
+                return
+            entry["levels"][level] = image
+            # The entry may have been evicted or replaced meanwhile
+            if self.entries.get(path) is entry:
+                self.bytes += image.sizeInBytes()
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                _, old = self.entries.popitem(last=False)
+                self.bytes -= sum(image.sizeInBytes() for image in old["levels"].values())
+
+    def invalidate(self, path, stamp=None):
+        # Levels are dropped at once; thumbnails they were made from are
+        # removed if the size and mtime of the old file are known
+        with self._lock:
+            entry = self.entries.pop(path, None)
+            if entry is not None:
+                self.bytes -= sum(image.sizeInBytes() for image in entry["levels"].values())
+        if stamp is not None:
+            for level in MIP_LEVELS:
+                self.thumbnails.remove(self.thumbnails.key(path, level, level, True, stamp))
+
+    def stats(self):
+        with self._lock:
+            return dict(hits = self.hits, misses = self.misses, bytes = self.bytes, entries = len(self.entries))
+
+    def size(self, path):
+        entry = self._entry(path)
+        if entry is None:
+            return None
+        return entry["size"]
+
+    def get(self, path, size):
+        # Returns the smallest level whose longer side is at least size pixels
+        entry = self._entry(path)
+        if entry is None:
+            return QtGui.QImage()
+        level = self.level_for(size)
+        with self._lock:
+            levels = dict(entry["levels"])
+            if level in levels:
+                self.hits += 1
+            else:
+                self.misses += 1
+        image = levels.get(level)
+        if image is not None:
+            return image
+        larger = [l for l in levels if l > level]
+        if larger:
+            source = levels[min(larger)]
+            image = source.scaled(level, level, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+        else:
+            image = self.thumbnails.cached(path, level, level, keep_aspect=True)
+        if image.isNull():
+            # Larger levels left on disk by `warm` or earlier runs are cheaper
+            # to scale down than the image is to decode
+            for larger in MIP_LEVELS[MIP_LEVELS.index(level) + 1:]:
+                source = self.thumbnails.cached(path, larger, larger, keep_aspect=True)
+                if not source.isNull():
+                    self._add(path, entry, larger, source)
+                    image = source.scaled(level, level, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+                    break
+        if image.isNull():
+            image = self.thumbnails.get(path, level, level, keep_aspect=True)
+            if image.isNull():
+                return image
+        self._add(path, entry, level, image)
+        return image
+
+_mip_cache = None
+
+def get_mip_cache():
+    global _mip_cache
+    if _mip_cache is None:
+        _mip_cache = MipCache()
+    return _mip_cache
+
+# Previews of screens are shared by all screens, of any configuration, which
+# show the same image in the same mode at the same size. Previews which are
+# shown are referenced by their screens and are never evicted; only the ones
+# which are not shown anymore count towards the limit. Used from the GUI
+# thread only, as it holds QPixmaps.
+
+DEFAULT_PREVIEW_CACHE_SIZE = 64 * 1024 * 1024
+
+class PreviewCache:
+    def __init__(self, max_bytes=DEFAULT_PREVIEW_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        # key -> [pixmap, number of references]
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _bytes(pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def insert(self, key, image):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = [QtGui.QPixmap.fromImage(image), 0]
+            # Room is made before adding, so that the new entry is not evicted
+            # before the screens waiting for it take a reference
+            self.evict(self._bytes(entry[0]))
+            self.entries[key] = entry
+            self.bytes += self._bytes(entry[0])
+        return entry[0]
+
+    def acquire(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry[1] += 1
+
+    def release(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                self.entries.move_to_end(key)
+                self.evict()
+
+    def evict(self, needed=0):
+        if self.bytes + needed <= self.max_bytes:
+            return
+        for key in [key for key, entry in self.entries.items() if entry[1] <= 0]:
+            self.bytes -= self._bytes(self.entries.pop(key)[0])
+            if self.bytes + needed <= self.max_bytes:
+                break
+
+    def stats(self):
+        referenced = sum(1 for entry in self.entries.values() if entry[1] > 0)
+        return dict(hits = self.hits, misses = self.misses, bytes = self.bytes,
+                    entries = len(self.entries), referenced = referenced)
+
+_preview_cache = None
+
+def get_preview_cache():
+    global _preview_cache
+    if _preview_cache is None:
+        _preview_cache = PreviewCache()
+    return _preview_cache
@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+from math import log
+from hashlib import blake2b
+from os.path import abspath, exists, join, splitext
+from concurrent.futures import ThreadPoolExecutor
+from cache import get_cache_dir
+from playlist import IMAGE_EXTENSIONS
+from store import open_store
+import profiling
+
+# Index of wallpaper folders, kept in the cache directory. Images are
+# revalidated by size and mtime, so only new and changed files are read:
+# their pixel dimensions come from the image header, and a hash of their
+# content lets configurations follow wallpapers which were moved or renamed.
+#
+# Queries do not need Qt, so new configurations can be filled on `apply`.
+
+LIBRARY_VERSION = 1
+HASH_CHUNK = 1024 * 1024
+
+def get_library_path():
+    return join(get_cache_dir(), "library.json")
+
+def content_hash(path):
+    h = blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def scan_images(folder):
+    stack = [folder]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.name.startswith("."):
+                        stack.append(entry.path)
+                elif splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                    yield entry.path, entry.stat()
+            except OSError:
+                pass
+
+def fit_score(image, width, height):
+    # Lower is better: aspect ratio mismatch costs the most, then upscaling,
+    # then images much larger than the output, which take long to decode
+    aspect = abs(log(image["w"] / image["h"]) - log(width / height))
+    scale = log(max(width / image["w"], height / image["h"]))
+    if scale > 0:
+        return 4 * aspect + scale
+    return 4 * aspect - 0.1 * scale
+
+class Library:
+    def __init__(self, path=None):
+        self.path = path or get_library_path()
+        self.folders = []
+        self.images = dict()
+        # Content hashes of images which disappeared, to find where they moved
+        self.gone = dict()
+        self._by_hash = None
+        if exists(self.path):
+            with profiling.span("read library"), open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.folders = data.get("folders", [])
+            self.images = data.get("images", dict())
+            self.gone = data.get("gone", dict())
+
+    def save(self):
+        os.makedirs(get_cache_dir(), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(dict(version = LIBRARY_VERSION, folders = self.folders, images = self.images, gone = self.gone),
+                      f, separators=(',', ':'))
+        os.replace(tmp, self.path)
+
+    def add_folder(self, folder):
+        folder = abspath(folder)
+        if folder not in self.folders:
+            self.folders.append(folder)
+
+    def _read(self, path, st):
+        from decode import image_size
+        size = image_size(path)
+        if size is None:
+            return None
+        return dict(size = st.st_size, mtime = st.st_mtime_ns, w = size[0], h = size[1],
+                    hash = content_hash(path))
+
+    def update(self, workers=None, verbose=False):
+        found = dict()
+        for folder in self.folders:
+            for path, st in scan_images(folder):
+                found[path] = st
+        changed = []
+        for path, st in found.items():
+            entry = self.images.get(path)
+            if entry is None or entry["size"] != st.st_size or entry["mtime"] != st.st_mtime_ns:
+                changed.append(path)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            entries = list(pool.map(lambda path: self._read(path, found[path]), changed))
+        for path in list(self.images.keys()):
+            if path not in found:
+                self.gone[path] = self.images.pop(path)["hash"]
+        for path, entry in zip(changed, entries):
+            if entry is None:
+                self.images.pop(path, None)
+                if verbose:
+                    print(f"Can not read {path}")
+                continue
+            self.images[path] = entry
+            self.gone.pop(path, None)
+        self._by_hash = None
+        return len(changed), len(found)
+
+    def by_hash(self):
+        if self._by_hash is None:
+            self._by_hash = dict((entry["hash"], path) for path, entry in self.images.items())
+        return self._by_hash
+
+    def relink(self, path):
+        if not path or exists(path):
+            return path
+        entry = self.images.get(path)
+        content = entry["hash"] if entry is not None else self.gone.get(path)
+        if content is None:
+            return path
+        return self.by_hash().get(content, path)
+
+    def best_fit(self, width, height, exclude=()):
+        best = None
+        best_score = None
+        for path, image in self.images.items():
+            if path in exclude:
+                continue
+            score = fit_score(image, width, height)
+            if best_score is None or score < best_score or (score == best_score and path < best):
+                best = path
+                best_score = score
+        return best
+
+    def autofill(self, config, overwrite=False):
+        used = set() if overwrite else set(screen.path for screen in config.screens if screen.path)
+        n_filled = 0
+        for screen in config.screens:
+            if screen.path and not overwrite:
+                continue
+            # Prefer different images on different monitors
+            path = self.best_fit(screen.width, screen.height, used) or self.best_fit(screen.width, screen.height)
+            if path is None:
+                break
+            screen.path = path
+            used.add(path)
+            n_filled += 1
+        return n_filled
+
+_library = None
+
+def get_library():
+    global _library
+    if _library is None:
+        _library = Library()
+    return _library
+
+def autofill_new(config):
+    if not exists(get_library_path()):
+        return 0
+    return get_library().autofill(config)
+
+def run_library(args):
+    from engine import ConfigRecord, detect_screens
+    library = get_library()
+    if args.action == "add":
+        for folder in args.folders:
+            library.add_folder(folder)
+    if args.action in ("add", "update"):
+        n_changed, n_found = library.update(args.jobs, args.verbose)
+        library.save()
+        print(f"Indexed {n_changed} new or changed images, {n_found} images in {len(library.folders)} folders")
+        return
+    store = open_store(args)
+    if args.action == "autofill":
+        if args.id is None:
+            config = ConfigRecord.current_from_store(store, detect_screens(), args.verbose)
+        else:
+            config = ConfigRecord.load(store, args.id)
+        if config is None:
+            print(f"No configuration with such ID: {args.id}")
+            sys.exit(1)
+        library.autofill(config, args.overwrite)
+        for screen in config.screens:
+            print(f"{screen.tostring()}: {screen.path}")
+        config.save(store)
+        store.sync()
+    elif args.action == "relink":
+        # Moved files are found by the content hashes of the ones which disappeared
+        library.update(args.jobs, args.verbose)
+        library.save()
+        for config in ConfigRecord.list_from_store(store):
+            n_relinked = 0
+            for screen in config.screens:
+                path = library.relink(screen.path)
+                if path != screen.path:
+                    print(f"{config.name}: {screen.name()}: {screen.path} -> {path}")
+                    screen.path = path
+                    n_relinked += 1
+            if config.span is not None:
+                path = library.relink(config.span.path)
+                if path != config.span.path:
+                    print(f"{config.name}: spanned wallpaper: {config.span.path} -> {path}")
+                    config.span.path = path
+                    n_relinked += 1
+            if n_relinked:
+                config.save(store)
+        store.sync()
+    else:
+        print(f"{len(library.images)} images in {len(library.folders)} folders:")
+        for folder in library.folders:
+            print(f"\t{folder}")
@@ -0,0 +1,69 @@
+import os
+import time
+from os.path import abspath, dirname, isdir, join, splitext
+
+# No Qt imports here: slides are resolved on the `apply` fast path.
+#
+# The wallpaper of a screen can be a single image, a directory of images or a
+# playlist file listing one image per line. Slides change at multiples of the
+# interval since the epoch, so `apply` shows the same slide as the daemon, and
+# screens with equal intervals change at the same moment.
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".ppm", ".pgm", ".xpm", ".tif", ".tiff"}
+PLAYLIST_EXTENSIONS = {".m3u", ".m3u8", ".lst", ".txt"}
+
+_playlists = dict()
+
+def is_playlist(path):
+    return bool(path) and (isdir(path) or splitext(path)[1].lower() in PLAYLIST_EXTENSIONS)
+
+def _read_images(path):
+    if isdir(path):
+        images = [entry.path for entry in os.scandir(path)
+                  if splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS and entry.is_file()]
+        return sorted(images)
+    base = dirname(abspath(path))
+    images = []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                images.append(join(base, line))
+    return images
+
+def playlist_images(path):
+    if not is_playlist(path):
+        return [path]
+    try:
+        stamp = os.stat(path).st_mtime_ns
+    except OSError:
+        return []
+    cached = _playlists.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        images = _read_images(path)
+    except OSError:
+        images = []
+    _playlists[path] = (stamp, images)
+    return images
+
+def slide_index(interval, count, when=None):
+    if interval <= 0 or count <= 1:
+        return 0
+    if when is None:
+        when = time.time()
+    return int(when // interval) % count
+
+def next_change(interval, when=None):
+    if when is None:
+        when = time.time()
+    return (when // interval + 1) * interval
+
+def current_image(path, interval, when=None):
+    if not path:
+        return None
+    images = playlist_images(path)
+    if not images:
+        return None
+    return images[slide_index(interval, len(images), when)]
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+
+# Timing spans for --profile. When profiling is not enabled, span() returns a
+# shared no-op context manager, so instrumented code pays only for one call.
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_null_span = NullSpan()
+_tracer = None
+
+class Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        self.tracer.events.append((self.name, self.start, end - self.start, threading.get_ident()))
+        return False
+
+class Tracer:
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter()
+
+    def span(self, name):
+        return Span(self, name)
+
+    def write_trace(self, path):
+        pid = os.getpid()
+        events = []
+        for name, start, duration, tid in self.events:
+            events.append(dict(name = name, ph = "X", pid = pid, tid = tid,
+                               ts = (start - self.origin) * 1e6, dur = duration * 1e6))
+        with open(path, 'w') as f:
+            json.dump(dict(traceEvents = events, displayTimeUnit = "ms"), f)
+
+    def summary(self):
+        stats = dict()
+        for name, _, duration, _ in self.events:
+            count, total, longest = stats.get(name, (0, 0.0, 0.0))
+            stats[name] = (count + 1, total + duration, max(longest, duration))
+        lines = [f"{'span':<32} {'count':>6} {'total, ms':>10} {'mean, ms':>10} {'max, ms':>10}"]
+        for name, (count, total, longest) in sorted(stats.items(), key = lambda item: -item[1][1]):
+            lines.append(f"{name:<32} {count:>6} {total*1000:>10.2f} {total*1000/count:>10.2f} {longest*1000:>10.2f}")
+        return "\n".join(lines)
+
+def span(name):
+    if _tracer is None:
+        return _null_span
+    return _tracer.span(name)
+
+def enable(path):
+    global _tracer
+    _tracer = Tracer()
+
+    def finish():
+        _tracer.write_trace(path)
+        print(_tracer.summary(), file=sys.stderr)
+        print(f"Trace written to {path}", file=sys.stderr)
+
+    atexit.register(finish)
@@ -0,0 +1,126 @@
+import os
+import shutil
+from os.path import join
+from PyQt5 import QtCore
+from cache import FileCache, get_cache_dir, atomic_save, file_key
+import profiling
+
+# QtGui is imported only when something has to be rendered, so that applying
+# wallpapers which are already in the cache does not need to load it.
+
+# Rendered images are stored as PNG without compression: they are larger on
+# disk, but xwallpaper does not have to spend time inflating them.
+RENDER_FORMAT = "PNG"
+RENDER_QUALITY = 100
+DEFAULT_RENDER_CACHE_SIZE = 1024 * 1024 * 1024
+
+def save_render(image, path):
+    return atomic_save(image, path, RENDER_FORMAT, RENDER_QUALITY)
+
+def read_image(path, width=None, height=None, mode="--zoom"):
+    from decode import decode_image
+    return decode_image(path, width, height, mode)
+
+def compose(source, mode, width, height, scale=1.0):
+    # scale is the size of source pixels in the result for --center and --tile,
+    # which is not 1 when previews are drawn from downscaled images
+    from PyQt5 import QtGui
+    if mode == "--stretch":
+        return source.scaled(width, height, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation)
+    if mode in ("--center", "--tile") and scale != 1.0:
+        source = source.scaled(max(1, round(source.width() * scale)), max(1, round(source.height() * scale)),
+                               QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation)
+    canvas = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
+    canvas.fill(QtGui.QColor("black"))
+    painter = QtGui.QPainter(canvas)
+    if mode == "--tile":
+        for y in range(0, height, source.height()):
+            for x in range(0, width, source.width()):
+                painter.drawImage(x, y, source)
+    else:
+        if mode == "--maximize":
+            image = source.scaled(width, height, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+        elif mode == "--center":
+            image = source
+        else:
+            image = source.scaled(width, height, QtCore.Qt.KeepAspectRatioByExpanding, QtCore.Qt.SmoothTransformation)
+        painter.drawImage((width - image.width()) // 2, (height - image.height()) // 2, image)
+    painter.end()
+    return canvas
+
+def render_image(path, mode, width, height):
+    return compose(read_image(path, width, height, mode), mode, width, height)
+
+class RenderCache(FileCache):
+    def __init__(self, directory=None, max_bytes=DEFAULT_RENDER_CACHE_SIZE):
+        if directory is None:
+            directory = join(get_cache_dir(), "render")
+        super().__init__(directory, max_bytes)
+
+    @staticmethod
+    def key(path, mode, width, height, stamp=None):
+        return file_key(path, mode, f"{width}x{height}", stamp=stamp)
+
+    def get(self, path, mode, width, height):
+        key = self.key(path, mode, width, height)
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+        with profiling.span("render image"):
+            image = render_image(path, mode, width, height)
+        with profiling.span("write render cache"):
+            cached = self.store(key, image, RENDER_FORMAT, RENDER_QUALITY)
+        if cached is None:
+            raise OSError(f"Can not write render cache in {self.directory}")
+        return cached
+
+_render_cache = None
+
+def get_render_cache():
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = RenderCache()
+    return _render_cache
+
+def span_layout(screens, bezel_x, bezel_y):
+    min_x = min(s.x for s in screens)
+    min_y = min(s.y for s in screens)
+    columns = sorted(set(s.x for s in screens))
+    rows = sorted(set(s.y for s in screens))
+    rects = dict()
+    for screen in screens:
+        x = screen.x - min_x + columns.index(screen.x) * bezel_x
+        y = screen.y - min_y + rows.index(screen.y) * bezel_y
+        rects[screen.hashkey()] = QtCore.QRect(x, y, screen.width, screen.height)
+    width = max(r.x() + r.width() for r in rects.values())
+    height = max(r.y() + r.height() for r in rects.values())
+    return rects, QtCore.QSize(width, height)
+
+def span_key(config_id, span, rects):
+    layout = sorted((key, r.x(), r.y(), r.width(), r.height()) for key, r in rects.items())
+    return f"{config_id}-{file_key(span.path, layout)}"
+
+def render_span(config_id, span, screens):
+    rects, canvas_size = span_layout(screens, span.bezel_x, span.bezel_y)
+    key = span_key(config_id, span, rects)
+    base_dir = join(get_cache_dir(), "span")
+    directory = join(base_dir, key)
+    slices = dict((screen_key, join(directory, f"{screen_key}.png")) for screen_key in rects)
+    if all(os.path.exists(path) for path in slices.values()):
+        return slices
+
+    image = read_image(span.path, canvas_size.width(), canvas_size.height(), "--zoom")
+    with profiling.span("render span"):
+        image = image.scaled(canvas_size, QtCore.Qt.KeepAspectRatioByExpanding, QtCore.Qt.SmoothTransformation)
+    dx = (image.width() - canvas_size.width()) // 2
+    dy = (image.height() - canvas_size.height()) // 2
+    os.makedirs(directory, exist_ok=True)
+    for screen_key, rect in rects.items():
+        if not save_render(image.copy(rect.translated(dx, dy)), slices[screen_key]):
+            raise OSError(f"Can not write spanned wallpaper in {directory}")
+
+    # Slices rendered for previous versions of this configuration are not needed anymore
+    for entry in os.scandir(base_dir):
+        if entry.name.startswith(config_id + "-") and entry.name != key:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    return slices
@@ -0,0 +1,118 @@
+import os
+import sys
+import profiling
+
+# Native backend: composes the root window pixmap in process with python-xlib
+# and publishes it in _XROOTPMAP_ID/ESETROOT_PMAP_ID like xwallpaper does, so
+# neither a shell nor xwallpaper is started and images which are already
+# decoded are not decoded again. It handles only images rendered to the exact
+# size of their outputs; everything else is left to xwallpaper.
+
+BACKENDS = ["xwallpaper", "native"]
+
+_backend = "xwallpaper"
+# Images of the last applied outputs, reused when only some outputs change
+_frames = dict()
+
+def set_backend(name):
+    global _backend
+    _backend = name
+
+def get_backend():
+    return _backend
+
+def _load(path, width, height):
+    from PyQt5 import QtGui
+    st = os.stat(path)
+    frame = _frames.get(path)
+    if frame is not None and frame[0] == (st.st_size, st.st_mtime_ns):
+        return frame[1]
+    with profiling.span("decode image"):
+        image = QtGui.QImage(path)
+    if image.isNull() or image.width() != width or image.height() != height:
+        raise OSError(f"Can not read rendered image: {path}")
+    image = image.convertToFormat(QtGui.QImage.Format_RGB32)
+    _frames[path] = ((st.st_size, st.st_mtime_ns), image)
+    return image
+
+def _check_format(d, screen):
+    from Xlib import X
+    info = d.display.info
+    if info.image_byte_order != X.LSBFirst or sys.byteorder != "little":
+        raise OSError("Only LSB first image byte order is supported")
+    depth = screen.root_depth
+    formats = [f for f in info.pixmap_formats if f.depth == depth]
+    if not formats or formats[0].bits_per_pixel != 32:
+        raise OSError(f"Only 32 bits per pixel are supported, depth of root window is {depth}")
+    for allowed in screen.allowed_depths:
+        for visual in allowed.visuals:
+            if visual.visual_id == screen.root_visual:
+                if (visual.red_mask, visual.green_mask, visual.blue_mask) != (0xff0000, 0xff00, 0xff):
+                    raise OSError("Only RGB888 visuals are supported")
+                return depth
+    raise OSError("Root visual not found")
+
+def _put_image(d, pixmap, gc, x, y, image, depth):
+    from Xlib import X
+    data = image.constBits().asstring(image.sizeInBytes())
+    stride = image.bytesPerLine()
+    # Stay within the maximum request length, which is counted in 4 byte units
+    max_bytes = d.display.info.max_request_length * 4 - 64
+    rows = max(1, max_bytes // stride)
+    for top in range(0, image.height(), rows):
+        n_rows = min(rows, image.height() - top)
+        pixmap.put_image(gc, x, y + top, image.width(), n_rows, X.ZPixmap, depth, 0,
+                         data[top * stride:(top + n_rows) * stride])
+
+def set_root_pixmap(outputs):
+    try:
+        from Xlib import error
+    except ImportError:
+        raise OSError("python-xlib is not installed")
+    try:
+        _set_root_pixmap(outputs)
+    except (error.DisplayError, error.ConnectionClosedError, error.XError) as e:
+        raise OSError(f"X error: {e}") from e
+
+def _set_root_pixmap(outputs):
+    from Xlib import X, Xatom, display
+    frames = []
+    for screen, mode, path in outputs:
+        if mode != "--center":
+            raise OSError(f"Image for {screen.name()} is not rendered to the size of the output")
+        frames.append((screen, _load(path, screen.width, screen.height)))
+    d = display.Display()
+    try:
+        screen = d.screen()
+        root = screen.root
+        depth = _check_format(d, screen)
+        pixmap = root.create_pixmap(screen.width_in_pixels, screen.height_in_pixels, depth)
+        gc = pixmap.create_gc(foreground = screen.black_pixel)
+        pixmap.fill_rectangle(gc, 0, 0, screen.width_in_pixels, screen.height_in_pixels)
+        with profiling.span("upload images"):
+            for output, image in frames:
+                _put_image(d, pixmap, gc, output.x, output.y, image, depth)
+        gc.free()
+
+        xrootpmap = d.intern_atom("_XROOTPMAP_ID")
+        esetroot = d.intern_atom("ESETROOT_PMAP_ID")
+        # Free the pixmap left by the previous wallpaper setter, if it is the
+        # one in use, as other setters do
+        old = root.get_full_property(xrootpmap, Xatom.PIXMAP)
+        old_esetroot = root.get_full_property(esetroot, Xatom.PIXMAP)
+        if old is not None and old_esetroot is not None and old.value[0] == old_esetroot.value[0]:
+            d.kill_client(old.value[0])
+        root.change_property(xrootpmap, Xatom.PIXMAP, 32, [pixmap.id])
+        root.change_property(esetroot, Xatom.PIXMAP, 32, [pixmap.id])
+        root.change_attributes(background_pixmap = pixmap)
+        root.clear_area()
+        # Keep the pixmap after this connection is closed
+        d.set_close_down_mode(X.RetainPermanent)
+        d.sync()
+    finally:
+        d.close()
+    # Only images of the current outputs are worth keeping
+    paths = set(path for _, _, path in outputs)
+    for path in list(_frames.keys()):
+        if path not in paths:
+            del _frames[path]
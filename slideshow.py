@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5 import QtCore
+from playlist import next_change
+from render import get_render_cache
+
+# Slides are decoded and rendered to the size of their outputs on a worker
+# thread while the current slides are shown, so that changing them only needs
+# a render cache hit. All screens due at the same moment are changed by one
+# `xwallpaper` call, which sets the other screens to their current slides.
+
+class Slideshow(QtCore.QObject):
+    due = QtCore.pyqtSignal(float)
+
+    def __init__(self, parent=None, verbose=False):
+        super().__init__(parent)
+        self.verbose = verbose
+        self.config = None
+        self.when = None
+        self.prefetched = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.timeout.connect(self._on_timeout)
+
+    def start(self, config, when=None):
+        self.stop()
+        self.config = config
+        screens = config.slideshow_screens()
+        if not screens:
+            return
+        if when is None:
+            when = time.time()
+        self.when = min(next_change(screen.interval, when) for screen in screens)
+        due_screens = [screen for screen in screens if next_change(screen.interval, when) == self.when]
+        self.prefetched = self.executor.submit(self._prefetch, due_screens, self.when)
+        self.timer.start(max(0, int((self.when - time.time()) * 1000)))
+        if self.verbose:
+            names = ", ".join(screen.name() for screen in due_screens)
+            print(f"Next slide for {names} in {self.when - when:.0f} s")
+
+    def stop(self):
+        self.timer.stop()
+        self.config = None
+        self.when = None
+        self.prefetched = None
+
+    def shutdown(self):
+        self.stop()
+        self.executor.shutdown(wait=True)
+
+    def _prefetch(self, screens, when):
+        cache = get_render_cache()
+        for screen in screens:
+            path = screen.image(when)
+            if not path:
+                continue
+            try:
+                cache.get(path, screen.mode, screen.width, screen.height)
+            except OSError as e:
+                if self.verbose:
+                    print(f"Can not prefetch {path} for {screen.name()}: {e}")
+
+    def _on_timeout(self):
+        # Timers may fire a little early; slides are chosen for the scheduled moment
+        remaining = self.when - time.time()
+        if remaining > 0.001:
+            self.timer.start(max(1, int(remaining * 1000)))
+            return
+        if self.prefetched is not None:
+            self.prefetched.result()
+        self.due.emit(self.when)
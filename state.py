@@ -0,0 +1,75 @@
+import os
+import re
+import tempfile
+from os.path import join
+
+# Fingerprints of the wallpapers last applied on each X display. Each one is
+# stored together with the identity of the X server it was applied to (inode
+# and ctime of its socket), because the runtime directory may outlive the
+# server (lingering, ssh sessions) and the wallpaper must be set again on a
+# new server. Displays which can not be identified are never skipped.
+
+X11_SOCKETS_DIR = "/tmp/.X11-unix"
+LOCAL_DISPLAY_RE = re.compile(r"^(?:unix)?:(\d+)(?:\.\d+)?$")
+
+def get_state_dir():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return join(runtime_dir, "xwallpapergui")
+    return join(tempfile.gettempdir(), f"xwallpapergui-{os.getuid()}")
+
+def get_display(display=None):
+    if display is None:
+        display = os.environ.get("DISPLAY", "")
+    return display
+
+def get_server_id(display=None):
+    match = LOCAL_DISPLAY_RE.match(get_display(display))
+    if match is None:
+        return None
+    try:
+        st = os.stat(join(X11_SOCKETS_DIR, f"X{match.group(1)}"))
+    except OSError:
+        return None
+    return f"{st.st_ino}-{st.st_ctime_ns}"
+
+def get_state_path(display=None):
+    name = "".join(c if c.isalnum() else "_" for c in get_display(display))
+    return join(get_state_dir(), f"applied-{name}")
+
+def _own_dir(directory):
+    # The fallback directory is in /tmp, where anybody could have created it
+    try:
+        st = os.stat(directory)
+    except OSError:
+        return False
+    return st.st_uid == os.getuid()
+
+def read_applied(display=None):
+    server_id = get_server_id(display)
+    if server_id is None or not _own_dir(get_state_dir()):
+        return None
+    try:
+        with open(get_state_path(display), encoding='utf-8') as f:
+            applied_server_id, _, fingerprint = f.read().strip().partition(" ")
+    except OSError:
+        return None
+    if applied_server_id != server_id:
+        return None
+    return fingerprint
+
+def write_applied(fingerprint, display=None):
+    server_id = get_server_id(display)
+    if server_id is None:
+        return
+    path = get_state_path(display)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(get_state_dir(), mode=0o700, exist_ok=True)
+        if not _own_dir(get_state_dir()):
+            return
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(f"{server_id} {fingerprint}\n")
+        os.replace(tmp, path)
+    except OSError:
+        pass
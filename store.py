@@ -0,0 +1,180 @@
+import os
+import json
+from os.path import abspath, dirname, exists, join, splitext
+from PyQt5 import QtCore
+import profiling
+
+# Configuration stores keep each configuration as a plain dict:
+#
+#   {"name": ..., "screens": [{"x", "y", "w", "h", "name", "manufacturer",
+#    "model", "serial_number", "path", "mode", "interval"}, ...],
+#    "span": {"path", "bezel_x", "bezel_y"} or None}
+#
+# keyed by configuration ID, which is the hash of the set of screens.
+
+SCREEN_KEYS = ["x", "y", "w", "h", "name", "manufacturer", "model", "serial_number", "path", "mode", "interval"]
+SCREEN_INT_KEYS = {"x", "y", "w", "h", "interval"}
+JSON_STORE_VERSION = 1
+
+# Stores write only what differs from the last known state of a
+# configuration, and write the file only in sync(), atomically.
+
+class QSettingsStore:
+    def __init__(self, settings):
+        self.settings = settings
+        self.path = settings.fileName()
+        self._known = dict()
+
+    def ids(self):
+        prefix = "config_"
+        prefix_len = len(prefix)
+        return [key[prefix_len:] for key in self.settings.childGroups() if key.startswith(prefix)]
+
+    def get(self, id):
+        settings = self.settings
+        section = f"config_{id}"
+        name = settings.value(f"{section}/name")
+        if not name:
+            return None
+        n_screens = settings.beginReadArray(f"{section}/screens")
+        screens = []
+        for i in range(n_screens):
+            settings.setArrayIndex(i)
+            screen = dict()
+            for key in SCREEN_KEYS:
+                if key in SCREEN_INT_KEYS:
+                    screen[key] = settings.value(key, type=int)
+                else:
+                    screen[key] = settings.value(key)
+            screens.append(screen)
+        settings.endArray()
+        span = None
+        span_path = settings.value(f"{section}/span/path")
+        if span_path:
+            span = dict(path = span_path,
+                        bezel_x = settings.value(f"{section}/span/bezel_x", 0, type=int),
+                        bezel_y = settings.value(f"{section}/span/bezel_y", 0, type=int))
+        data = dict(name = name, screens = screens, span = span)
+        self._known[id] = data
+        return data
+
+    def put(self, id, data):
+        old = self._known.get(id)
+        if old is None:
+            old = self.get(id)
+        if old == data:
+            return
+        settings = self.settings
+        section = f"config_{id}"
+        if old is None or old["name"] != data["name"]:
+            settings.setValue(f"{section}/name", data["name"])
+        old_screens = old["screens"] if old is not None else []
+        if len(old_screens) != len(data["screens"]):
+            settings.remove(f"{section}/screens")
+            old_screens = []
+        settings.beginWriteArray(f"{section}/screens", len(data["screens"]))
+        for i, screen in enumerate(data["screens"]):
+            settings.setArrayIndex(i)
+            old_screen = old_screens[i] if i < len(old_screens) else dict()
+            for key in SCREEN_KEYS:
+                if key not in old_screen or old_screen[key] != screen[key]:
+                    settings.setValue(key, screen[key])
+        settings.endArray()
+        span = data.get("span")
+        if old is None or old.get("span") != span:
+            settings.remove(f"{section}/span")
+            if span is not None:
+                for key, value in span.items():
+                    settings.setValue(f"{section}/span/{key}", value)
+        self._known[id] = data
+
+    def sync(self):
+        with profiling.span("sync qsettings"):
+            self.settings.sync()
+        # Somebody else may have changed the file
+        self._known.clear()
+
+class JsonStore:
+    def __init__(self, path):
+        self.path = path
+        self._configs = None
+        self._stamp = None
+        # IDs changed here since the last sync; only these are written over
+        # what other processes saved meanwhile
+        self._dirty = set()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_size, st.st_mtime_ns)
+        except OSError:
+            return None
+
+    def _load(self):
+        self._stamp = self._file_stamp()
+        if self._stamp is None:
+            self._configs = dict()
+            return
+        with profiling.span("parse json store"), open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        self._configs = data.get("configs", dict())
+
+    def _index(self):
+        if self._configs is None:
+            self._load()
+        return self._configs
+
+    def ids(self):
+        return list(self._index().keys())
+
+    def get(self, id):
+        return self._index().get(id)
+
+    def put(self, id, data):
+        configs = self._index()
+        if configs.get(id) == data:
+            return
+        configs[id] = data
+        self._dirty.add(id)
+
+    def sync(self):
+        if self._configs is not None and self._file_stamp() != self._stamp:
+            changed = dict((id, self._configs[id]) for id in self._dirty)
+            self._load()
+            self._configs.update(changed)
+        if not self._dirty:
+            return
+        directory = dirname(abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with profiling.span("write json store"), open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(dict(version = JSON_STORE_VERSION, configs = self._configs), f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._stamp = self._file_stamp()
+        self._dirty.clear()
+
+def migrate(source, target):
+    n_configs = 0
+    for id in source.ids():
+        data = source.get(id)
+        if data is not None:
+            target.put(id, data)
+            n_configs += 1
+    target.sync()
+    return n_configs
+
+def open_store(args):
+    if args.config:
+        path = abspath(args.config)
+        if splitext(path)[1] == ".json":
+            return JsonStore(path)
+        return QSettingsStore(QtCore.QSettings(path, QtCore.QSettings.Format.NativeFormat))
+    settings = QtCore.QSettings("xwallpapergui", "xwallpapergui")
+    store = JsonStore(join(dirname(settings.fileName()), "xwallpapergui.json"))
+    if not exists(store.path) and exists(settings.fileName()):
+        n_configs = migrate(QSettingsStore(settings), store)
+        if args.verbose:
+            print(f"Migrated {n_configs} configurations from {settings.fileName()} to {store.path}")
+    return store